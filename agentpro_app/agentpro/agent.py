@@ -70,11 +70,13 @@ class AgentResponse(BaseModel):
     final_answer: Optional[str] = Field(None, description="The final answer from the agent")
 
     def to_dict(self) -> Dict:
-        """Convert to dictionary format."""
-        return {
-            "thought_process": [step.model_dump() for step in self.thought_process],
-            "final_answer": self.final_answer
-        }
+        """
+        Convert to dictionary format.
+
+        A single model_dump walks the nested steps inside pydantic-core
+        instead of dumping each step from a Python loop.
+        """
+        return self.model_dump(include={"thought_process", "final_answer"})
 
     def get_final_answer(self) -> str:
         """Get the final answer or empty string."""
@@ -3,10 +3,48 @@ GenerateFlashcardsTool: LLM-based tool for generating spaced-repetition flashcar
 """
 
 import json
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 from openai import OpenAI
 from .base_tool import Tool
 
+SYSTEM_PROMPT = """You are creating flashcards for spaced repetition learning.
+
+**Instructions:**
+1. Create concise, focused flashcards (one concept per card)
+2. Use two formats:
+   - **Q&A**: Question on front, answer on back
+   - **Cloze**: Fill-in-the-blank style with {{c1::answer}}
+3. Include page citations
+4. Tag each card with concept keywords
+5. Rate difficulty (1-5 scale, 1=easiest)
+
+**Output Format:**
+## Flashcard Set: [Topic]
+
+### Card 1 (Q&A)
+**Front:** [Clear, specific question]
+**Back:** [Concise answer with brief explanation]
+**Tags:** #concept1 #concept2
+**Difficulty:** 2/5
+**Source:** (Title, p.X)
+
+---
+
+### Card 2 (Cloze)
+**Text:** The {{c1::base case}} prevents infinite recursion by providing a {{c2::termination condition}}.
+**Tags:** #recursion #fundamentals
+**Difficulty:** 1/5
+**Source:** (Title, p.Y)
+
+---
+
+## Spaced Repetition Schedule
+- **Today (Day 1):** Review all cards
+- **Day 3:** Review cards 1, 3, 5, 7, 9
+- **Day 7:** Review cards with difficulty 3+
+- **Day 14:** Review all cards again
+"""
+
 
 class GenerateFlashcardsTool(Tool):
     """
@@ -20,10 +58,10 @@ class GenerateFlashcardsTool(Tool):
     action_type: str = "generate_flashcards"
     input_format: str = '{"query": "topic", "context": [...], "num_cards": 10}'
 
-    def __init__(self, model: str = "gpt-4o-mini", temperature: float = 0.3, **data):
+    def __init__(self, model: str = "gpt-4o-mini", temperature: float = 0.3, client: Optional[OpenAI] = None, **data):
         super().__init__(**data)
         from agentpro_app.config import OPENAI_API_KEY
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        self.client = client or OpenAI(api_key=OPENAI_API_KEY)
         self.model = model
         self.temperature = temperature
 
@@ -73,45 +111,6 @@ class GenerateFlashcardsTool(Tool):
             # Format context
             ctx = self._format_context(context)
 
-            # System prompt
-            system = """You are creating flashcards for spaced repetition learning.
-
-**Instructions:**
-1. Create concise, focused flashcards (one concept per card)
-2. Use two formats:
-   - **Q&A**: Question on front, answer on back
-   - **Cloze**: Fill-in-the-blank style with {{c1::answer}}
-3. Include page citations
-4. Tag each card with concept keywords
-5. Rate difficulty (1-5 scale, 1=easiest)
-
-**Output Format:**
-## Flashcard Set: [Topic]
-
-### Card 1 (Q&A)
-**Front:** [Clear, specific question]
-**Back:** [Concise answer with brief explanation]
-**Tags:** #concept1 #concept2
-**Difficulty:** 2/5
-**Source:** (Title, p.X)
-
----
-
-### Card 2 (Cloze)
-**Text:** The {{c1::base case}} prevents infinite recursion by providing a {{c2::termination condition}}.
-**Tags:** #recursion #fundamentals
-**Difficulty:** 1/5
-**Source:** (Title, p.Y)
-
----
-
-## Spaced Repetition Schedule
-- **Today (Day 1):** Review all cards
-- **Day 3:** Review cards 1, 3, 5, 7, 9
-- **Day 7:** Review cards with difficulty 3+
-- **Day 14:** Review all cards again
-"""
-
             user = f"""Create {num_cards} flashcards for: **{query}**
 
 **Context:**
@@ -123,7 +122,7 @@ Generate varied flashcards (mix Q&A and cloze formats). Focus on key concepts an
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": system},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": user}
                 ],
                 temperature=self.temperature,
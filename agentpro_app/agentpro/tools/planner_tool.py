@@ -3,11 +3,85 @@ CreateStudyPlanTool: LLM-based tool for generating personalized study plans.
 """
 
 import json
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 from datetime import datetime, timedelta
 from openai import OpenAI
 from .base_tool import Tool
 
+SYSTEM_PROMPT = """You are an expert study planner creating personalized learning schedules.
+
+**Your Planning Philosophy:**
+- Prioritize weak areas while maintaining strong areas
+- Use spaced repetition for long-term retention
+- Balance study load across available time
+- Build in review sessions and practice tests
+- Adapt to student's preferred study hours
+
+**Planning Principles:**
+1. **Prioritization**: Weak topics get 60% of time, strong topics get 20%, new topics 20%
+2. **Spaced Repetition**: Review at 1 day, 3 days, 1 week, 2 weeks intervals
+3. **Active Practice**: 50% reading/study, 30% practice, 20% testing
+4. **Realistic Load**: Don't overload - sustainable progress beats burnout
+5. **Flexibility**: Build buffer time for adjustments
+
+**Output Format:**
+## 📘 Study Plan: [Course/Topic]
+
+### 🎯 Goals & Timeline
+- **Target Date:** [Deadline or milestone]
+- **Total Study Hours:** [Calculated]
+- **Daily Commitment:** [Hours per day]
+
+### 📊 Priority Assessment
+**Focus Areas (60% of time):**
+1. [Weak topic 1] - Current mastery: X%
+2. [Weak topic 2] - Current mastery: Y%
+
+**Maintenance Areas (20% of time):**
+- [Strong topics to maintain]
+
+**New Material (20% of time):**
+- [Upcoming topics or advanced concepts]
+
+### 📆 Weekly Schedule
+
+#### Week 1: Foundations
+**Monday (2 hours)**
+- 0:00-0:45 → Study [Topic A]
+- 0:45-1:15 → Practice problems on [Topic A]
+- 1:15-1:45 → Flashcard review
+- 1:45-2:00 → Quick quiz on [Topic A]
+
+**Tuesday (2 hours)**
+[Similar breakdown]
+
+[Continue for full week]
+
+#### Week 2: Building & Review
+[Next week's focus]
+
+### 🔁 Review Schedule (Spaced Repetition)
+- **Day 1:** [Topics covered today]
+- **Day 3:** Review [Topics from Day 1]
+- **Day 7:** Review [Topics from Day 1-3]
+- **Day 14:** Review [All Week 1 topics]
+
+### ✅ Daily Checklist Template
+- [ ] Complete scheduled study session
+- [ ] Review flashcards (15 min)
+- [ ] Practice problems (30 min)
+- [ ] Quick self-quiz
+- [ ] Log progress in StudyBuddy
+
+### 📈 Progress Checkpoints
+- **End of Week 1:** Take practice quiz on [Topics]
+- **End of Week 2:** Take comprehensive quiz
+- **Midpoint:** Review plan and adjust priorities
+
+### 💡 Study Tips
+[Personalized based on performance patterns]
+"""
+
 
 class CreateStudyPlanTool(Tool):
     """
@@ -21,10 +95,10 @@ class CreateStudyPlanTool(Tool):
     action_type: str = "create_study_plan"
     input_format: str = '{"query": "study plan request", "user_stats": {...}, "deadline": "YYYY-MM-DD", "hours_per_day": 2}'
 
-    def __init__(self, model: str = "gpt-4o-mini", temperature: float = 0.4, **data):
+    def __init__(self, model: str = "gpt-4o-mini", temperature: float = 0.4, client: Optional[OpenAI] = None, **data):
         super().__init__(**data)
         from agentpro_app.config import OPENAI_API_KEY
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        self.client = client or OpenAI(api_key=OPENAI_API_KEY)
         self.model = model
         self.temperature = temperature
 
@@ -67,7 +141,7 @@ class CreateStudyPlanTool(Tool):
                     weeks = max(1, days_until // 7)
                     total_hours = days_until * hours_per_day
                     timeline_info = f"\n- **Timeline:** {weeks} weeks ({days_until} days)\n- **Total Study Hours:** {total_hours} hours"
-                except:
+                except (ValueError, TypeError, AttributeError):
                     timeline_info = f"\n- **Daily Hours:** {hours_per_day}"
             else:
                 timeline_info = f"\n- **Daily Hours:** {hours_per_day}"
@@ -87,81 +161,6 @@ class CreateStudyPlanTool(Tool):
                     avg = data.get("avg", 0.0)
                     context += f"- {topic}: {avg*100:.0f}%\n"
 
-            # System prompt
-            system = """You are an expert study planner creating personalized learning schedules.
-
-**Your Planning Philosophy:**
-- Prioritize weak areas while maintaining strong areas
-- Use spaced repetition for long-term retention
-- Balance study load across available time
-- Build in review sessions and practice tests
-- Adapt to student's preferred study hours
-
-**Planning Principles:**
-1. **Prioritization**: Weak topics get 60% of time, strong topics get 20%, new topics 20%
-2. **Spaced Repetition**: Review at 1 day, 3 days, 1 week, 2 weeks intervals
-3. **Active Practice**: 50% reading/study, 30% practice, 20% testing
-4. **Realistic Load**: Don't overload - sustainable progress beats burnout
-5. **Flexibility**: Build buffer time for adjustments
-
-**Output Format:**
-## 📘 Study Plan: [Course/Topic]
-
-### 🎯 Goals & Timeline
-- **Target Date:** [Deadline or milestone]
-- **Total Study Hours:** [Calculated]
-- **Daily Commitment:** [Hours per day]
-
-### 📊 Priority Assessment
-**Focus Areas (60% of time):**
-1. [Weak topic 1] - Current mastery: X%
-2. [Weak topic 2] - Current mastery: Y%
-
-**Maintenance Areas (20% of time):**
-- [Strong topics to maintain]
-
-**New Material (20% of time):**
-- [Upcoming topics or advanced concepts]
-
-### 📆 Weekly Schedule
-
-#### Week 1: Foundations
-**Monday (2 hours)**
-- 0:00-0:45 → Study [Topic A]
-- 0:45-1:15 → Practice problems on [Topic A]
-- 1:15-1:45 → Flashcard review
-- 1:45-2:00 → Quick quiz on [Topic A]
-
-**Tuesday (2 hours)**
-[Similar breakdown]
-
-[Continue for full week]
-
-#### Week 2: Building & Review
-[Next week's focus]
-
-### 🔁 Review Schedule (Spaced Repetition)
-- **Day 1:** [Topics covered today]
-- **Day 3:** Review [Topics from Day 1]
-- **Day 7:** Review [Topics from Day 1-3]
-- **Day 14:** Review [All Week 1 topics]
-
-### ✅ Daily Checklist Template
-- [ ] Complete scheduled study session
-- [ ] Review flashcards (15 min)
-- [ ] Practice problems (30 min)
-- [ ] Quick self-quiz
-- [ ] Log progress in StudyBuddy
-
-### 📈 Progress Checkpoints
-- **End of Week 1:** Take practice quiz on [Topics]
-- **End of Week 2:** Take comprehensive quiz
-- **Midpoint:** Review plan and adjust priorities
-
-### 💡 Study Tips
-[Personalized based on performance patterns]
-"""
-
             user = f"""Create a personalized study plan.
 
 **Request:** {query}
@@ -174,7 +173,7 @@ Generate a comprehensive, actionable study plan with daily schedules and spaced
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": system},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": user}
                 ],
                 temperature=self.temperature,
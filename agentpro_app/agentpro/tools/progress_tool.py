@@ -3,10 +3,20 @@ AnalyzeProgressTool: Tool for analyzing student progress and providing recommend
 """
 
 import json
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 from openai import OpenAI
 from .base_tool import Tool
 
+SYSTEM_PROMPT = """You are an expert learning coach analyzing student progress.
+
+Provide:
+1. Detailed insights into learning patterns
+2. Specific recommendations for improvement
+3. Actionable next steps
+4. Motivational feedback
+
+Keep your analysis concise but insightful. Focus on actionable advice."""
+
 
 class AnalyzeProgressTool(Tool):
     """
@@ -20,10 +30,12 @@ class AnalyzeProgressTool(Tool):
     action_type: str = "analyze_progress"
     input_format: str = '{"user_id": "user123", "course_id": "course456", "analysis_type": "overview|detailed|recommendations"}'
 
-    def __init__(self, model: str = "gpt-4o-mini", temperature: float = 0.7, **data):
+    def __init__(self, model: str = "gpt-4o-mini", temperature: float = 0.7, client: Optional[OpenAI] = None, **data):
         super().__init__(**data)
         from agentpro_app.config import OPENAI_API_KEY
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        from agentpro_app.persistence import database
+        self.db = database
+        self.client = client or OpenAI(api_key=OPENAI_API_KEY)
         self.model = model
         self.temperature = temperature
 
@@ -149,16 +161,6 @@ class AnalyzeProgressTool(Tool):
             "mastery_scores": user_stats.get("mastery_scores", {})
         }, indent=2)
 
-        system = """You are an expert learning coach analyzing student progress.
-
-Provide:
-1. Detailed insights into learning patterns
-2. Specific recommendations for improvement
-3. Actionable next steps
-4. Motivational feedback
-
-Keep your analysis concise but insightful. Focus on actionable advice."""
-
         user = f"""Analyze this student's learning progress and provide personalized recommendations:
 
 {context}
@@ -169,7 +171,7 @@ Generate detailed insights and recommendations."""
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": system},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": user}
                 ],
                 temperature=self.temperature,
@@ -210,9 +212,7 @@ Generate detailed insights and recommendations."""
                 return "ERROR: Missing required fields: user_id, course_id"
 
             # Load user stats from database
-            from agentpro_app.persistence.database import Database
-            db = Database()
-            user_stats = db.get_stats(user_id, course_id)
+            user_stats = self.db.get_stats(user_id, course_id)
 
             # Generate analysis based on type
             if analysis_type == "detailed" or analysis_type == "recommendations":
@@ -3,7 +3,7 @@ GenerateQuizTool: LLM-based tool for generating adaptive quizzes.
 """
 
 import json
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 from openai import OpenAI
 from .base_tool import Tool
 
@@ -20,10 +20,10 @@ class GenerateQuizTool(Tool):
     action_type: str = "generate_quiz"
     input_format: str = '{"query": "topic", "context": [...], "difficulty": "easy|medium|hard", "num_questions": 6, "user_stats": {...}}'
 
-    def __init__(self, model: str = "gpt-4o-mini", temperature: float = 0.4, **data):
+    def __init__(self, model: str = "gpt-4o-mini", temperature: float = 0.4, client: Optional[OpenAI] = None, **data):
         super().__init__(**data)
         from agentpro_app.config import OPENAI_API_KEY
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        self.client = client or OpenAI(api_key=OPENAI_API_KEY)
         self.model = model
         self.temperature = temperature
 
@@ -4,18 +4,81 @@ RoutingTool: LLM-based intelligent routing tool for agent selection.
 This tool replaces rule-based routing with LLM-powered decision making.
 """
 
-import json
-from typing import Any, Dict
+import hashlib
+import re
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import orjson
 from openai import OpenAI
 from .base_tool import Tool
 
+SYSTEM_PROMPT = """You are an intelligent routing agent for StudyBuddy, an AI tutoring system.
+
+Your job is to analyze user requests and route them to the most appropriate specialized agent:
+
+**Available Agents:**
+
+1. **tutor** - Study Guide & Explanation Agent
+   - Use for: Explanations, learning new concepts, clarifications, general Q&A
+   - Generates: Comprehensive study guides with citations, examples, and practice questions
+   - Best when: User wants to understand or learn something
+
+2. **quiz_coach** - Adaptive Quiz Generation Agent
+   - Use for: Assessment, testing knowledge, practice questions
+   - Generates: Adaptive quizzes with multiple question types and answer keys
+   - Best when: User wants to test their knowledge or practice
+
+3. **planner** - Study Planning & Scheduling Agent
+   - Use for: Study plans, schedules, time management, preparation strategies
+   - Generates: Weekly schedules with spaced repetition and prioritized topics
+   - Best when: User wants to plan their studying or needs a schedule
+
+4. **flashcards** - Flashcard Generation Agent
+   - Use for: Memorization, spaced repetition, quick review materials
+   - Generates: Q&A and cloze deletion flashcards with review schedules
+   - Best when: User wants flashcards or quick review materials
+
+**Routing Guidelines:**
+- If mode is specified (guide, quiz, plan, flashcards), strongly prefer the corresponding agent
+- Consider query keywords: "explain", "how" → tutor; "quiz", "test" → quiz_coach; "plan", "schedule" → planner; "flashcard", "memorize" → flashcards
+- Consider context: If user has many weak topics and asks a vague question, planner might help
+- Default to tutor for general questions
+
+**Output Format:**
+Respond with ONLY a JSON object:
+{
+  "agent": "tutor|quiz_coach|planner|flashcards",
+  "reasoning": "Brief explanation of why this agent was chosen"
+}
+"""
+
+# Explicit modes map straight to their agent
+MODE_TO_AGENT = {
+    "guide": "tutor",
+    "quiz": "quiz_coach",
+    "plan": "planner",
+    "flashcards": "flashcards",
+}
+
+# Unambiguous keywords, one group per agent (same order as _FAST_ROUTE_AGENTS).
+# A bare "test" is left to the LLM: "unit tests", "hypothesis test" are topics.
+_FAST_ROUTES = re.compile(
+    r"\b(quiz(?:zes)?|test me|assessments?)\b"
+    r"|\b(flashcards?|anki)\b"
+    r"|\b(plan|schedule|deadline|study.plan)\b"
+    r"|\b(explain|what is|how does|guide)\b",
+    re.IGNORECASE,
+)
+_FAST_ROUTE_AGENTS = ("quiz_coach", "flashcards", "planner", "tutor")
+
 
 class RoutingTool(Tool):
     """
     LLM-based routing tool that decides which agent should handle a request.
 
     Uses retrieval results, query content, mode, and memory to intelligently
-    route to the appropriate specialized agent.
+    route to the appropriate specialized agent. Decisions are cached per
+    (query, mode, context_summary) so retries and refreshes skip the LLM call.
     """
 
     name: str = "Route Request"
@@ -23,12 +86,53 @@ class RoutingTool(Tool):
     action_type: str = "route"
     input_format: str = '{"query": "user query", "mode": "guide|quiz|plan|flashcards", "context_summary": "...", "user_stats": {...}}'
 
-    def __init__(self, model: str = "gpt-4o-mini", temperature: float = 0.2, **data):
+    def __init__(self, model: str = "gpt-4o-mini", temperature: float = 0.2, client: Optional[OpenAI] = None, cache_size: int = 1024, **data):
         super().__init__(**data)
         from agentpro_app.config import OPENAI_API_KEY
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        self.client = client or OpenAI(api_key=OPENAI_API_KEY)
         self.model = model
         self.temperature = temperature  # Low temperature for consistent routing
+        self.cache_size = cache_size
+        self._route_cache: "OrderedDict[str, str]" = OrderedDict()
+
+    @staticmethod
+    def _cache_key(query: str, mode: str, context_summary: str) -> str:
+        """Build a compact cache key for a routing request."""
+        raw = f"{query}|{mode}|{context_summary}"
+        return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+    @staticmethod
+    def _fast_route(query: str, mode: str) -> Optional[str]:
+        """
+        Decide obvious cases without the LLM.
+
+        Returns the agent name when the mode is explicit or the query matches
+        keywords for exactly one agent, otherwise None.
+        """
+        if mode in MODE_TO_AGENT:
+            return MODE_TO_AGENT[mode]
+
+        matched = {
+            _FAST_ROUTE_AGENTS[m.lastindex - 1]
+            for m in _FAST_ROUTES.finditer(query)
+        }
+        if len(matched) == 1:
+            return matched.pop()
+        return None
+
+    def _cache_get(self, key: str) -> Optional[str]:
+        """Return a cached routing decision (refreshing its LRU position) or None."""
+        cached = self._route_cache.get(key)
+        if cached is not None:
+            self._route_cache.move_to_end(key)
+        return cached
+
+    def _cache_put(self, key: str, decision: str) -> None:
+        """Store a routing decision, evicting the least recently used entry."""
+        self._route_cache[key] = decision
+        self._route_cache.move_to_end(key)
+        while len(self._route_cache) > self.cache_size:
+            self._route_cache.popitem(last=False)
 
     def run(self, input_data: Any) -> str:
         """
@@ -43,11 +147,11 @@ class RoutingTool(Tool):
         try:
             # Parse input
             if isinstance(input_data, str):
-                params = json.loads(input_data)
+                params = orjson.loads(input_data)
             elif isinstance(input_data, dict):
                 params = input_data
             else:
-                return json.dumps({"error": "Invalid input format"})
+                return orjson.dumps({"error": "Invalid input format"}).decode()
 
             query = params.get("query", "")
             mode = params.get("mode", "")
@@ -55,7 +159,21 @@ class RoutingTool(Tool):
             user_stats = params.get("user_stats", {})
 
             if not query:
-                return json.dumps({"error": "Missing required field 'query'"})
+                return orjson.dumps({"error": "Missing required field 'query'"}).decode()
+
+            # Explicit modes and single-intent keywords skip the LLM entirely
+            fast_agent = self._fast_route(query, mode)
+            if fast_agent:
+                return orjson.dumps({
+                    "agent": fast_agent,
+                    "reasoning": f"Fast route: mode '{mode}'" if mode in MODE_TO_AGENT else "Fast route: keyword match"
+                }).decode()
+
+            # Identical requests get the same routing decision
+            cache_key = self._cache_key(query, mode, context_summary)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                return cached
 
             # Build context for routing decision
             weak_topics = user_stats.get("weak_topics", [])
@@ -72,47 +190,6 @@ class RoutingTool(Tool):
 - Weak Topics: {', '.join(weak_topics) if weak_topics else 'None identified'}
 - Strong Topics: {', '.join(strong_topics) if strong_topics else 'None identified'}
 - Quizzes Taken: {len(quiz_history)}
-"""
-
-            # System prompt for routing
-            system = """You are an intelligent routing agent for StudyBuddy, an AI tutoring system.
-
-Your job is to analyze user requests and route them to the most appropriate specialized agent:
-
-**Available Agents:**
-
-1. **tutor** - Study Guide & Explanation Agent
-   - Use for: Explanations, learning new concepts, clarifications, general Q&A
-   - Generates: Comprehensive study guides with citations, examples, and practice questions
-   - Best when: User wants to understand or learn something
-
-2. **quiz_coach** - Adaptive Quiz Generation Agent
-   - Use for: Assessment, testing knowledge, practice questions
-   - Generates: Adaptive quizzes with multiple question types and answer keys
-   - Best when: User wants to test their knowledge or practice
-
-3. **planner** - Study Planning & Scheduling Agent
-   - Use for: Study plans, schedules, time management, preparation strategies
-   - Generates: Weekly schedules with spaced repetition and prioritized topics
-   - Best when: User wants to plan their studying or needs a schedule
-
-4. **flashcards** - Flashcard Generation Agent
-   - Use for: Memorization, spaced repetition, quick review materials
-   - Generates: Q&A and cloze deletion flashcards with review schedules
-   - Best when: User wants flashcards or quick review materials
-
-**Routing Guidelines:**
-- If mode is specified (guide, quiz, plan, flashcards), strongly prefer the corresponding agent
-- Consider query keywords: "explain", "how" → tutor; "quiz", "test" → quiz_coach; "plan", "schedule" → planner; "flashcard", "memorize" → flashcards
-- Consider context: If user has many weak topics and asks a vague question, planner might help
-- Default to tutor for general questions
-
-**Output Format:**
-Respond with ONLY a JSON object:
-{
-  "agent": "tutor|quiz_coach|planner|flashcards",
-  "reasoning": "Brief explanation of why this agent was chosen"
-}
 """
 
             user = f"""Route this request to the appropriate agent:
@@ -125,7 +202,7 @@ Decide which agent should handle this request."""
             response = self.client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": system},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": user}
                 ],
                 temperature=self.temperature,
@@ -142,33 +219,38 @@ Decide which agent should handle this request."""
                 elif "```" in result:
                     result = result.split("```")[1].split("```")[0].strip()
 
-                routing_decision = json.loads(result)
+                routing_decision = orjson.loads(result)
+                if not isinstance(routing_decision, dict):
+                    raise ValueError("Routing decision is not a JSON object")
 
                 # Validate agent choice
                 valid_agents = ["tutor", "quiz_coach", "planner", "flashcards"]
                 if routing_decision.get("agent") not in valid_agents:
                     routing_decision["agent"] = "tutor"  # Default fallback
 
-                return json.dumps(routing_decision, indent=2)
+                decision = orjson.dumps(routing_decision, option=orjson.OPT_INDENT_2).decode()
+                self._cache_put(cache_key, decision)
+                return decision
 
-            except json.JSONDecodeError:
+            except ValueError:  # includes orjson.JSONDecodeError
                 # Fallback: parse text response
+                lowered = result.lower()
                 agent = "tutor"  # Default
-                if "quiz_coach" in result.lower() or "quiz" in result.lower():
+                if "quiz" in lowered:
                     agent = "quiz_coach"
-                elif "planner" in result.lower() or "plan" in result.lower():
+                elif "plan" in lowered:
                     agent = "planner"
-                elif "flashcards" in result.lower() or "flashcard" in result.lower():
+                elif "flashcard" in lowered:
                     agent = "flashcards"
 
-                return json.dumps({
+                return orjson.dumps({
                     "agent": agent,
                     "reasoning": "Fallback routing based on text analysis"
-                })
+                }).decode()
 
         except Exception as e:
             # Emergency fallback
-            return json.dumps({
+            return orjson.dumps({
                 "agent": "tutor",
                 "reasoning": f"Error in routing, defaulting to tutor: {str(e)}"
-            })
+            }).decode()
@@ -3,7 +3,7 @@ GenerateStudyGuideTool: LLM-based tool for generating comprehensive study guides
 """
 
 import json
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 from openai import OpenAI
 from .base_tool import Tool
 
@@ -20,10 +20,10 @@ class GenerateStudyGuideTool(Tool):
     action_type: str = "generate_study_guide"
     input_format: str = '{"query": "topic to explain", "context": [{"text": "...", "title": "...", "page": "..."}], "user_stats": {...}}'
 
-    def __init__(self, model: str = "gpt-4o-mini", temperature: float = 0.3, **data):
+    def __init__(self, model: str = "gpt-4o-mini", temperature: float = 0.3, client: Optional[OpenAI] = None, **data):
         super().__init__(**data)
         from agentpro_app.config import OPENAI_API_KEY
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        self.client = client or OpenAI(api_key=OPENAI_API_KEY)
         self.model = model
         self.temperature = temperature
 
@@ -14,7 +14,14 @@ load_dotenv(env_path)
 # Expose environment variables as constants
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 CHAT_MODEL = os.getenv("CHAT_MODEL")
+# Per-path model overrides: routing only needs a small, fast model
+ROUTER_MODEL = os.getenv("ROUTER_MODEL", "gpt-4o-mini")
+PLANNER_MODEL = os.getenv("PLANNER_MODEL", CHAT_MODEL)
+QUIZ_MODEL = os.getenv("QUIZ_MODEL", CHAT_MODEL)
+# Context window (tokens) that generator prompts are trimmed to fit
+MODEL_CONTEXT_TOKENS = int(os.getenv("MODEL_CONTEXT_TOKENS", "128000"))
 MODEL_PROVIDER = os.getenv("MODEL_PROVIDER")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 
 # Ensure critical variables are loaded
 if not OPENAI_API_KEY:
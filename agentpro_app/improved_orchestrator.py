@@ -8,20 +8,39 @@ This orchestrator uses a streamlined approach:
 4. Proper error handling and logging
 """
 
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
+from collections import OrderedDict
+import hashlib
 import json
+import logging
+import threading
+import time
 from openai import OpenAI
 from dataclasses import dataclass
 
-from agentpro_app.config import CHAT_MODEL, OPENAI_API_KEY
-from agentpro_app.rag import hybrid_retrieve
+from agentpro_app.config import CHAT_MODEL, ROUTER_MODEL, PLANNER_MODEL, QUIZ_MODEL, OPENAI_API_KEY
+from agentpro_app.rag import hybrid_retrieve, course_version
 from agentpro_app.memory import load as load_memory, log_query
 from agentpro_app.persistence import database as db
 
 # Initialize OpenAI client
 client = OpenAI(api_key=OPENAI_API_KEY)
 
-print("[ORCHESTRATOR] Initialized with model:", CHAT_MODEL)
+logger = logging.getLogger("studybuddy.orchestrator")
+logger.info("Initialized with model: %s", CHAT_MODEL)
+
+# Short-lived cache of retrieval results for repeated queries (retries, refreshes)
+RETRIEVAL_CACHE_TTL = 60  # seconds
+RETRIEVAL_CACHE_SIZE = 512
+_retrieval_cache: "OrderedDict[Tuple, Tuple[float, List[Dict]]]" = OrderedDict()
+_retrieval_cache_lock = threading.Lock()  # process_request runs in worker threads
+
+# Generated answers keyed on a digest of the full prompt (context + query + settings).
+# Only deterministic paths use it; quizzes, flashcards and plans should vary on a re-ask.
+COMPLETION_CACHE_TTL = 300  # seconds
+COMPLETION_CACHE_SIZE = 256
+_completion_cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+_completion_cache_lock = threading.Lock()
 
 
 @dataclass
@@ -63,6 +82,10 @@ Analyze the user's request and determine the best agent and response type.
 5. "Flashcards" → flashcards + flashcards
 6. General questions → assistant + chat
 
+**For Planner:**
+- requires_retrieval: true if user mentions materials, documents, slides, specific topics
+- requires_retrieval: false for general time-based planning without content reference
+
 Return ONLY valid JSON:
 {
   "agent": "agent_name",
@@ -78,7 +101,7 @@ Return ONLY valid JSON:
     
     try:
         response = client.chat.completions.create(
-            model=CHAT_MODEL,
+            model=ROUTER_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
@@ -99,7 +122,7 @@ Return ONLY valid JSON:
         )
         
     except Exception as e:
-        print(f"[ROUTING ERROR] {str(e)}")
+        logger.warning("Routing failed, using default: %s", e)
         return RoutingDecision(
             agent="assistant",
             reasoning="Default routing",
@@ -109,6 +132,77 @@ Return ONLY valid JSON:
         )
 
 
+def _cached_retrieve(user_id: str, course_id: str, query: str, top_k: int) -> List[Dict]:
+    """
+    hybrid_retrieve with a TTL cache on (user, course, query, top_k).
+    The course version is part of the key, so an upload invalidates old entries.
+    """
+    key = (user_id, course_id, course_version(user_id, course_id), query, top_k)
+    now = time.monotonic()
+    
+    with _retrieval_cache_lock:
+        cached = _retrieval_cache.get(key)
+        if cached and now - cached[0] < RETRIEVAL_CACHE_TTL:
+            _retrieval_cache.move_to_end(key)
+            return cached[1]
+    
+    hits = hybrid_retrieve(user_id, course_id, query, k=top_k)
+    
+    with _retrieval_cache_lock:
+        _retrieval_cache[key] = (now, hits)
+        _retrieval_cache.move_to_end(key)
+        while len(_retrieval_cache) > RETRIEVAL_CACHE_SIZE:
+            _retrieval_cache.popitem(last=False)
+    
+    return hits
+
+
+def _cached_completion(
+    system_prompt: str,
+    user_prompt: str,
+    temperature: float,
+    max_tokens: int,
+    model: str = CHAT_MODEL,
+    cache: bool = True
+) -> str:
+    """
+    Chat completion memoized on a blake2b digest of the prompt and settings.
+    A follow-up with the same query over the same materials skips the LLM call.
+    Pass cache=False for generative tools where a repeat request should get
+    a fresh result.
+    """
+    payload = json.dumps([model, temperature, max_tokens, system_prompt, user_prompt])
+    key = hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+    now = time.monotonic()
+    
+    if cache:
+        with _completion_cache_lock:
+            cached = _completion_cache.get(key)
+            if cached and now - cached[0] < COMPLETION_CACHE_TTL:
+                _completion_cache.move_to_end(key)
+                return cached[1]
+    
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=temperature,
+        max_tokens=max_tokens
+    )
+    content = response.choices[0].message.content
+    
+    if cache:
+        with _completion_cache_lock:
+            _completion_cache[key] = (now, content)
+            _completion_cache.move_to_end(key)
+            while len(_completion_cache) > COMPLETION_CACHE_SIZE:
+                _completion_cache.popitem(last=False)
+    
+    return content
+
+
 def format_context_for_llm(hits: List[Dict]) -> str:
     """Format retrieval results for LLM context."""
     if not hits:
@@ -158,17 +252,7 @@ Keep responses brief and well-organized."""
 
     user_prompt = f"Summarize: {query}\n\nContext:\n{context}"
     
-    response = client.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        temperature=0.3,
-        max_tokens=1024
-    )
-    
-    return response.choices[0].message.content
+    return _cached_completion(system_prompt, user_prompt, temperature=0.3, max_tokens=1024)
 
 
 def generate_study_guide(query: str, context: str, user_stats: Dict) -> str:
@@ -191,17 +275,7 @@ Use inline citations: (Source, p.X)"""
     
     user_prompt = f"Create a study guide for: {query}\n\nMaterials:\n{context}{personalization}"
     
-    response = client.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        temperature=0.3,
-        max_tokens=2048
-    )
-    
-    return response.choices[0].message.content
+    return _cached_completion(system_prompt, user_prompt, temperature=0.3, max_tokens=2048)
 
 
 def generate_quiz(query: str, context: str, difficulty: str, num_questions: int, user_stats: Dict) -> str:
@@ -223,17 +297,7 @@ D) [Option]
 
     user_prompt = f"Create {num_questions} questions for: {query}\n\nContext:\n{context}"
     
-    response = client.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        temperature=0.3,
-        max_tokens=2048
-    )
-    
-    return response.choices[0].message.content
+    return _cached_completion(system_prompt, user_prompt, temperature=0.3, max_tokens=2048, model=QUIZ_MODEL, cache=False)
 
 
 def generate_study_plan(query: str, user_stats: Dict, deadline: Optional[str], hours_per_day: int, retrieval_results: List[Dict] = None) -> str:
@@ -288,8 +352,8 @@ Format for {time_info['days']} days:
 
 Reference specific chunks and pages when available."""
 
-    print(f"[PLANNER] Timeline: {time_info['days']} days, {time_info['hours_per_day']} hrs/day")
-    print(f"[PLANNER] Materials: {len(retrieval_results) if retrieval_results else 0} chunks")
+    logger.info("Planner timeline: %s days, %s hrs/day", time_info['days'], time_info['hours_per_day'])
+    logger.info("Planner materials: %d chunks", len(retrieval_results) if retrieval_results else 0)
     
     user_prompt = f"""Request: {query}
 
@@ -300,17 +364,7 @@ Reference specific chunks and pages when available."""
 
 Generate plan for EXACTLY {time_info['days']} days."""
     
-    response = client.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        temperature=0.4,
-        max_tokens=2500
-    )
-    
-    return response.choices[0].message.content
+    return _cached_completion(system_prompt, user_prompt, temperature=0.4, max_tokens=2500, model=PLANNER_MODEL, cache=False)
 
 
 def _parse_time_from_query(query: str, deadline: Optional[str], hours_per_day: int) -> Dict:
@@ -319,12 +373,12 @@ def _parse_time_from_query(query: str, deadline: Optional[str], hours_per_day: i
     from datetime import datetime
     
     query_lower = query.lower()
-    print(f"[TIME_PARSE] Parsing: '{query}'")
+    logger.debug("Parsing time from: %r", query)
     
     hour_match = re.search(r'(\d+)\s*(?:hour|hr|hours|hrs)(?!\s*(?:per|/|each))', query_lower)
     if hour_match:
         total_hours = int(hour_match.group(1))
-        print(f"[TIME_PARSE] Found hours: {total_hours}")
+        logger.debug("Found hours: %d", total_hours)
         return {
             'days': 1,
             'hours_per_day': total_hours,
@@ -337,7 +391,7 @@ def _parse_time_from_query(query: str, deadline: Optional[str], hours_per_day: i
     if day_match:
         days = int(day_match.group(1))
         hrs = hours_per_day or 2
-        print(f"[TIME_PARSE] Found days: {days}")
+        logger.debug("Found days: %d", days)
         return {
             'days': days,
             'hours_per_day': hrs,
@@ -373,17 +427,7 @@ Format:
 
     user_prompt = f"Create {num_cards} flashcards for: {query}\n\nContext:\n{context}"
     
-    response = client.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        temperature=0.3,
-        max_tokens=2048
-    )
-    
-    return response.choices[0].message.content
+    return _cached_completion(system_prompt, user_prompt, temperature=0.3, max_tokens=2048, cache=False)
 
 
 def process_request(
@@ -400,11 +444,10 @@ def process_request(
     **kwargs
 ) -> Dict:
     """Main entry point for processing requests."""
-    print(f"\n[ORCHESTRATOR] Processing: '{query[:50]}...'")
-    print(f"[ORCHESTRATOR] Mode: {mode}")
+    logger.info("Processing query=%r mode=%s", query[:50], mode)
     
     routing = route_request(query, mode_hint=mode)
-    print(f"[ROUTING] Agent: {routing.agent}, Type: {routing.response_type}")
+    logger.info("routing agent=%s type=%s reason=%s", routing.agent, routing.response_type, routing.reasoning)
     
     user_stats = db.get_stats(user_id, course_id)
     memory = load_memory(user_id, course_id)
@@ -413,14 +456,16 @@ def process_request(
     context_str = ""
     citations = []
     
-    # FORCE RETRIEVAL (Fix for routing bug)
-    if True:
-        print(f"[RAG] Retrieving top {top_k} chunks...")
-        retrieval_results = hybrid_retrieve(user_id, course_id, query, k=top_k)
-        print(f"[RAG] Retrieved {len(retrieval_results)} chunks")
+    # FORCE RETRIEVAL (Fix for routing bug), except for plans the router marks
+    # as material-free - generate_study_plan works without hits
+    if routing.response_type != "plan" or routing.requires_retrieval:
+        logger.debug("Retrieving top %d chunks", top_k)
+        retrieval_results = _cached_retrieve(user_id, course_id, query, top_k)
+        logger.info("Retrieved %d chunks", len(retrieval_results))
         
         if retrieval_results:
-            context_str = format_context_for_llm(retrieval_results)
+            # Only the top 5 chunks go into the prompt, matching the citations
+            context_str = format_context_for_llm(retrieval_results[:5])
             citations = extract_citations(retrieval_results)
     
     content = ""
@@ -447,18 +492,12 @@ def process_request(
             else:
                 system_prompt = "You are a helpful study assistant. Answer using the provided materials."
                 user_prompt = f"{query}\n\nContext:\n{context_str}"
-                response = client.chat.completions.create(
-                    model=CHAT_MODEL,
-                    messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
-                    temperature=0.5,
-                    max_tokens=1024
-                )
-                content = response.choices[0].message.content
+                content = _cached_completion(system_prompt, user_prompt, temperature=0.5, max_tokens=1024)
         
         thought_process.append({"step": "generation", "agent": routing.agent, "success": True})
         
     except Exception as e:
-        print(f"[ERROR] {str(e)}")
+        logger.exception("Generation failed")
         content = f"Error: {str(e)}"
         thought_process.append({"step": "generation", "error": str(e), "success": False})
     
@@ -4,7 +4,7 @@ Uses LLM-based orchestration for proper intent detection and routing.
 """
 
 import os
-from agentpro_app.config import OPENAI_API_KEY
+from agentpro_app.config import OPENAI_API_KEY, LOG_LEVEL
 
 print("[DEBUG] Loaded key:", OPENAI_API_KEY[:10] + "..." if OPENAI_API_KEY else "NO KEY")
 
@@ -15,12 +15,27 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import asyncio
+import logging
+import logging.handlers
+import queue
 import traceback
 
 from agentpro_app.rag import upsert_pdf, get_collection_stats
 from agentpro_app.persistence import database as db
 from agentpro_app.improved_orchestrator import process_request, route_request
 
+# App loggers hand records to a background listener so request threads
+# never block on stdout
+_log_queue = queue.SimpleQueue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("[%(name)s] %(levelname)s %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_handler)
+
+_app_logger = logging.getLogger("studybuddy")
+_app_logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+_app_logger.setLevel(LOG_LEVEL)
+_app_logger.propagate = False
+
 # Directory for uploaded PDF files
 UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -87,12 +102,19 @@ class PlanRequest(BaseModel):
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup."""
+    _log_listener.start()
     print("[STARTUP] StudyBuddy Pro v3.0 (Intelligent Routing) starting up...")
     print("[OK] Database initialized")
     print("[OK] LLM-based orchestrator ready")
     print("[OK] Intelligent routing enabled")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush queued log records."""
+    _log_listener.stop()
+
+
 @app.get("/")
 async def root():
     """Health check and API info."""
@@ -6,7 +6,9 @@ SQLite-based memory and progress tracking.
 from .database import (
     init_db,
     log_query,
+    log_queries_bulk,
     log_quiz_attempt,
+    log_quiz_attempts_bulk,
     get_stats,
     get_recent_queries,
     get_quiz_history,
@@ -18,7 +20,9 @@ from .database import (
 __all__ = [
     'init_db',
     'log_query',
+    'log_queries_bulk',
     'log_quiz_attempt',
+    'log_quiz_attempts_bulk',
     'get_stats',
     'get_recent_queries',
     'get_quiz_history',
@@ -141,19 +141,25 @@ def ensure_user_course(user_id: str, course_id: str) -> None:
 
 def log_query(user_id: str, course_id: str, query: str, mode: str) -> None:
     """Log a user query and increment study streak."""
+    log_queries_bulk(user_id, course_id, [(query, mode)])
+
+def log_queries_bulk(user_id: str, course_id: str, records: List[Tuple[str, str]]) -> None:
+    """Log many (query, mode) records in one transaction and bump the streak once per record."""
+    if not records:
+        return
     ensure_user_course(user_id, course_id)
     now = datetime.now().isoformat()
     
     with get_db() as conn:
-        conn.execute("""
+        conn.executemany("""
             INSERT INTO queries (user_id, course_id, query, mode, timestamp)
             VALUES (?, ?, ?, ?, ?)
-        """, (user_id, course_id, query, mode, now))
+        """, [(user_id, course_id, query, mode, now) for query, mode in records])
         
         conn.execute("""
-            UPDATE courses SET study_streak = study_streak + 1, last_updated = ?
+            UPDATE courses SET study_streak = study_streak + ?, last_updated = ?
             WHERE course_id = ? AND user_id = ?
-        """, (now, course_id, user_id))
+        """, (len(records), now, course_id, user_id))
 
 def log_quiz_attempt(
     user_id: str,
@@ -165,58 +171,82 @@ def log_quiz_attempt(
     answers: Optional[List[Dict]] = None
 ) -> None:
     """Log a quiz attempt and update mastery tracking."""
+    log_quiz_attempts_bulk(user_id, course_id, [(topic, score, total_questions, difficulty, answers)])
+
+def log_quiz_attempts_bulk(
+    user_id: str,
+    course_id: str,
+    records: List[Tuple[str, float, int, str, Optional[List[Dict]]]]
+) -> None:
+    """
+    Log many (topic, score, total_questions, difficulty, answers) attempts in
+    one transaction, updating each topic's mastery row once.
+    """
+    if not records:
+        return
     ensure_user_course(user_id, course_id)
     now = datetime.now().isoformat()
     
+    scores_by_topic: Dict[str, List[float]] = {}
+    for topic, score, _, _, _ in records:
+        scores_by_topic.setdefault(topic, []).append(score)
+    
     with get_db() as conn:
-        conn.execute("""
+        conn.executemany("""
             INSERT INTO quiz_attempts (user_id, course_id, topic, score, total_questions, difficulty, timestamp, answers)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (user_id, course_id, topic, score, total_questions, difficulty, now, 
-              json.dumps(answers) if answers else None))
-        
-        cursor = conn.execute("""
-            SELECT recent_scores, attempt_count FROM mastery_scores
-            WHERE user_id = ? AND course_id = ? AND topic = ?
-        """, (user_id, course_id, topic))
-        
-        row = cursor.fetchone()
-        
-        if row:
-            recent_scores = json.loads(row['recent_scores'])
-            recent_scores.append(score)
-            recent_scores = recent_scores[-10:]
-            
-            avg_score = sum(recent_scores) / len(recent_scores)
-            
-            conn.execute("""
-                UPDATE mastery_scores
-                SET avg_score = ?, last_attempt = ?, attempt_count = attempt_count + 1, recent_scores = ?
-                WHERE user_id = ? AND course_id = ? AND topic = ?
-            """, (avg_score, now, json.dumps(recent_scores), user_id, course_id, topic))
-        else:
-            conn.execute("""
-                INSERT INTO mastery_scores (user_id, course_id, topic, avg_score, first_attempt, last_attempt, recent_scores)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (user_id, course_id, topic, score, now, now, json.dumps([score])))
+        """, [
+            (user_id, course_id, topic, score, total_questions, difficulty, now,
+             json.dumps(answers) if answers else None)
+            for topic, score, total_questions, difficulty, answers in records
+        ])
         
-        cursor = conn.execute("""
-            SELECT avg_score FROM mastery_scores WHERE user_id = ? AND course_id = ? AND topic = ?
-        """, (user_id, course_id, topic))
-        
-        avg_score = cursor.fetchone()['avg_score']
+        for topic, scores in scores_by_topic.items():
+            _update_mastery(conn, user_id, course_id, topic, scores, now)
+
+def _update_mastery(
+    conn: sqlite3.Connection,
+    user_id: str,
+    course_id: str,
+    topic: str,
+    scores: List[float],
+    now: str
+) -> None:
+    """Fold new scores into a topic's rolling mastery (last 10) and refresh its status."""
+    row = conn.execute("""
+        SELECT recent_scores FROM mastery_scores
+        WHERE user_id = ? AND course_id = ? AND topic = ?
+    """, (user_id, course_id, topic)).fetchone()
+    
+    if row:
+        recent_scores = (json.loads(row['recent_scores']) + scores)[-10:]
+        avg_score = sum(recent_scores) / len(recent_scores)
         
-        if avg_score < 0.6:
-            status = 'weak'
-        elif avg_score > 0.8:
-            status = 'strong'
-        else:
-            status = 'moderate'
+        conn.execute("""
+            UPDATE mastery_scores
+            SET avg_score = ?, last_attempt = ?, attempt_count = attempt_count + ?, recent_scores = ?
+            WHERE user_id = ? AND course_id = ? AND topic = ?
+        """, (avg_score, now, len(scores), json.dumps(recent_scores), user_id, course_id, topic))
+    else:
+        recent_scores = scores[-10:]
+        avg_score = sum(recent_scores) / len(recent_scores)
         
         conn.execute("""
-            INSERT OR REPLACE INTO topics (user_id, course_id, topic, status, last_updated)
-            VALUES (?, ?, ?, ?, ?)
-        """, (user_id, course_id, topic, status, now))
+            INSERT INTO mastery_scores (user_id, course_id, topic, avg_score, first_attempt, last_attempt, attempt_count, recent_scores)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (user_id, course_id, topic, avg_score, now, now, len(scores), json.dumps(recent_scores)))
+    
+    if avg_score < 0.6:
+        status = 'weak'
+    elif avg_score > 0.8:
+        status = 'strong'
+    else:
+        status = 'moderate'
+    
+    conn.execute("""
+        INSERT OR REPLACE INTO topics (user_id, course_id, topic, status, last_updated)
+        VALUES (?, ?, ?, ?, ?)
+    """, (user_id, course_id, topic, status, now))
 
 def get_stats(user_id: str, course_id: str) -> Dict:
     """Get comprehensive statistics for a user in a course."""
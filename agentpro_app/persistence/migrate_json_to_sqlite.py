@@ -25,7 +25,7 @@ def migrate_json_memory():
         print("No JSON memory files found.")
         return
     
-    print(f"YOO"„ Found {len(json_files)} memory files to migrate...")
+    print(f"🔄 Found {len(json_files)} memory files to migrate...")
     
     migrated = 0
     errors = 0
@@ -51,27 +51,23 @@ def migrate_json_memory():
             # Ensure user and course exist
             db.ensure_user_course(user_id, course_id)
             
-            # Migrate queries
-            for query in data.get("last_queries", []):
-                if isinstance(query, dict):
-                    db.log_query(
-                        user_id,
-                        course_id,
-                        query.get("query", ""),
-                        query.get("mode", "chat")
-                    )
+            # Migrate queries and quiz history, one transaction each
+            db.log_queries_bulk(user_id, course_id, [
+                (query.get("query", ""), query.get("mode", "chat"))
+                for query in data.get("last_queries", [])
+                if isinstance(query, dict)
+            ])
             
-            # Migrate quiz history
-            for quiz in data.get("quiz_history", []):
-                db.log_quiz_attempt(
-                    user_id,
-                    course_id,
+            db.log_quiz_attempts_bulk(user_id, course_id, [
+                (
                     quiz.get("topic", "unknown"),
                     quiz.get("score", 0.0),
                     quiz.get("total_questions", 0),
                     quiz.get("difficulty", "medium"),
                     quiz.get("answers")
                 )
+                for quiz in data.get("quiz_history", [])
+            ])
             
             # Migrate goals
             for goal in data.get("goals", []):
@@ -91,25 +87,25 @@ def migrate_json_memory():
                 """, (data.get("study_streak", 0), user_id, course_id))
             
             migrated += 1
-            print(f"  âœ… Migrated successfully")
+            print(f"  ✅ Migrated successfully")
             
         except Exception as e:
-            print(f"  âŒ Error migrating {json_file}: {str(e)}")
+            print(f"  ❌ Error migrating {json_file}: {str(e)}")
             errors += 1
     
-    print(f"\nðŸŽ‰ Migration complete!")
-    print(f"  âœ… Migrated: {migrated}")
-    print(f"  âŒ Errors: {errors}")
+    print(f"\n🎉 Migration complete!")
+    print(f"  ✅ Migrated: {migrated}")
+    print(f"  ❌ Errors: {errors}")
     
     if errors == 0:
-        print(f"\nðŸ—'ï¸  You can now safely delete the memory/ directory")
+        print(f"\n🗑️  You can now safely delete the memory/ directory")
     else:
-        print(f"\nâš ï¸  Some files had errors. Review before deleting memory/ directory")
+        print(f"\n⚠️  Some files had errors. Review before deleting memory/ directory")
 
 
 def verify_migration():
     """Verify migration by comparing JSON and SQLite data."""
-    print("\nðŸ"Š Verifying migration...")
+    print("\n📊 Verifying migration...")
     
     with db.get_db() as conn:
         # Count users
@@ -1,4 +1,4 @@
-import os, hashlib, re
+import os, hashlib, re, threading
 from typing import List, Dict, Optional, Tuple
 from pypdf import PdfReader
 import chromadb
@@ -8,7 +8,8 @@ from rank_bm25 import BM25Okapi
 import numpy as np
 
 EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
-_embedder = SentenceTransformer(EMBED_MODEL)
+_embedder: Optional[SentenceTransformer] = None
+_embedder_lock = threading.Lock()
 
 CHROMA_DIR = os.path.join(os.path.dirname(__file__), "vectorstore")
 chroma_client = chromadb.PersistentClient(path=CHROMA_DIR, settings=Settings(allow_reset=False))
@@ -16,6 +17,10 @@ chroma_client = chromadb.PersistentClient(path=CHROMA_DIR, settings=Settings(all
 # In-memory BM25 index per collection (for prototype)
 bm25_indexes = {}
 
+# Bumped on every upload so callers caching retrieval results can tell
+# when a course's materials changed
+_course_versions: Dict[str, int] = {}
+
 def _collection_name(user_id: str, course_id: str) -> str:
     """Generate a unique collection name for user+course."""
     raw = f"{user_id}:{course_id}"
@@ -100,10 +105,19 @@ def pdf_to_chunks(path: str) -> List[Dict]:
     
     return chunks
 
+def _get_embedder() -> SentenceTransformer:
+    """Load the embedding model on first use instead of at import time."""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = SentenceTransformer(EMBED_MODEL)
+    return _embedder
+
 def embed_texts(texts: List[str]) -> List[List[float]]:
     if not texts:
         return []
-    embeddings = _embedder.encode(
+    embeddings = _get_embedder().encode(
         texts,
         convert_to_numpy=True,
         show_progress_bar=False,
@@ -158,8 +172,14 @@ def upsert_pdf(user_id: str, course_id: str, doc_id: str, title: str, path: str)
     except Exception as e:
         print(f"Warning: Could not build BM25 index: {e}")
     
+    _course_versions[col_name] = _course_versions.get(col_name, 0) + 1
+    
     return {"doc_id": doc_id, "chunks": len(chunks)}
 
+def course_version(user_id: str, course_id: str) -> int:
+    """Return a counter that changes whenever materials are added to the course."""
+    return _course_versions.get(_collection_name(user_id, course_id), 0)
+
 def cosine_similarity(a: List[float], b: List[float]) -> float:
     """Compute cosine similarity between two vectors."""
     dot_product = sum(x * y for x, y in zip(a, b))
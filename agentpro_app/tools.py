@@ -1,40 +1,25 @@
+import re
+import statistics
+from collections import Counter
 from typing import List, Dict, Optional
+import numpy as np
 from openai import OpenAI
 from agentpro_app.config import CHAT_MODEL, OPENAI_API_KEY
 
 # Initialize OpenAI client
 client = OpenAI(api_key=OPENAI_API_KEY)
 
-# Debug print for model
-print("[DEBUG] Using model:", CHAT_MODEL)
+# Topic-like words in past queries (5+ letters, same cutoff as len(word) > 4)
+_TOPIC_TOKEN = re.compile(r"[a-z]{5,}")
 
-def format_citations(hits: List[Dict]) -> str:
-    """Format hits with inline citations for LLM context."""
-    formatted = []
-    for i, h in enumerate(hits, 1):
-        title = h['meta'].get('title', 'Document')
-        page = h['meta'].get('page', '?')
-        snippet = h.get('snippet', h['text'][:150] + "...")
-        score = h.get('score', 0.0)
-        
-        formatted.append(
-            f"[{i}] ({title}, p.{page}, relevance: {score:.2f})\n{snippet}\n"
-        )
-    return "\n".join(formatted)
+# Mastery buckets: < 0.5, < 0.7, otherwise strong
+_MASTERY_BINS = [0.5, 0.7]
+_MASTERY_LEVELS = (("🔴", "Needs work"), ("🟡", "Developing"), ("🟢", "Strong"))
+# Vectorize only for users with hundreds of topics; below that the plain
+# comprehension is as fast and skips building the array
+_VECTORIZE_MASTERY_MIN = 256
 
-def study_guide(query: str, hits: List[Dict]) -> Dict:
-    """Generate comprehensive study guide with improved citations."""
-    if not hits:
-        return {
-            "type": "study_guide",
-            "content_md": "**No relevant materials found.**\n\nPlease upload course materials or try rephrasing your question.",
-            "citations": [],
-            "quality": "empty"
-        }
-    
-    ctx = format_citations(hits)
-    
-    system = """You are an expert tutor creating comprehensive study guides.
+STUDY_GUIDE_SYSTEM_PROMPT = """You are an expert tutor creating comprehensive study guides.
 
 **Instructions:**
 1. Create well-structured, clear explanations with examples
@@ -60,6 +45,73 @@ def study_guide(query: str, hits: List[Dict]) -> Dict:
 ## Practice Questions
 [2-3 questions to test understanding]
 """
+
+FLASHCARDS_SYSTEM_PROMPT = """You are creating flashcards for spaced repetition learning.
+
+**Instructions:**
+1. Create concise, focused flashcards (one concept per card)
+2. Use two formats:
+   - **Q&A**: Question on front, answer on back
+   - **Cloze**: Fill-in-the-blank style with {{c1::answer}}
+3. Include page citations
+4. Tag each card with concept keywords
+5. Rate difficulty (1-5 scale, 1=easiest)
+
+**Output Format:**
+## Flashcard Set: [Topic]
+
+### Card 1 (Q&A)
+**Front:** [Clear, specific question]
+**Back:** [Concise answer with brief explanation]
+**Tags:** #concept1 #concept2
+**Difficulty:** 2/5
+**Source:** (Title, p.X)
+
+---
+
+### Card 2 (Cloze)
+**Text:** The {{c1::base case}} prevents infinite recursion by providing a {{c2::termination condition}}.
+**Tags:** #recursion #fundamentals
+**Difficulty:** 1/5
+**Source:** (Title, p.Y)
+
+---
+
+## Spaced Repetition Schedule
+- **Today (Day 1):** Review all cards
+- **Day 3:** Review cards 1, 3, 5, 7, 9
+- **Day 7:** Review cards with difficulty 3+
+- **Day 14:** Review all cards again
+"""
+
+def format_citations(hits: List[Dict]) -> str:
+    """
+    Format hits with inline citations for LLM context.
+    Callers pass only the top hits; extra chunks cost prompt tokens without
+    improving generation.
+    """
+    formatted = []
+    for i, h in enumerate(hits, 1):
+        meta = h['meta']
+        # Only fall back to slicing the full text when there is no snippet
+        snippet = h['snippet'] if 'snippet' in h else h['text'][:150] + "..."
+        formatted.append(
+            f"[{i}] ({meta.get('title', 'Document')}, p.{meta.get('page', '?')}, "
+            f"relevance: {h.get('score', 0.0):.2f})\n{snippet}\n"
+        )
+    return "\n".join(formatted)
+
+def study_guide(query: str, hits: List[Dict]) -> Dict:
+    """Generate comprehensive study guide with improved citations."""
+    if not hits:
+        return {
+            "type": "study_guide",
+            "content_md": "**No relevant materials found.**\n\nPlease upload course materials or try rephrasing your question.",
+            "citations": [],
+            "quality": "empty"
+        }
+    
+    ctx = format_citations(hits[:5])
     
     user = f"""Create a study guide for: **{query}**
 
@@ -72,7 +124,7 @@ Generate a complete, citation-rich study guide."""
         response = client.chat.completions.create(
             model=CHAT_MODEL,
             messages=[
-                {"role": "system", "content": system},
+                {"role": "system", "content": STUDY_GUIDE_SYSTEM_PROMPT},
                 {"role": "user", "content": user}
             ],
             temperature=0.3,
@@ -123,7 +175,7 @@ def quiz_from_context(query: str, hits: List[Dict], num_q: int = 6, difficulty:
             "difficulty": difficulty
         }
     
-    ctx = format_citations(hits)
+    ctx = format_citations(hits[:5])
     
     system = f"""You are an expert educator creating assessments.
 
@@ -217,45 +269,7 @@ def flashcards_from_context(query: str, hits: List[Dict], num_cards: int = 10) -
             "citations": []
         }
     
-    ctx = format_citations(hits)
-    
-    system = """You are creating flashcards for spaced repetition learning.
-
-**Instructions:**
-1. Create concise, focused flashcards (one concept per card)
-2. Use two formats:
-   - **Q&A**: Question on front, answer on back
-   - **Cloze**: Fill-in-the-blank style with {{c1::answer}}
-3. Include page citations
-4. Tag each card with concept keywords
-5. Rate difficulty (1-5 scale, 1=easiest)
-
-**Output Format:**
-## Flashcard Set: [Topic]
-
-### Card 1 (Q&A)
-**Front:** [Clear, specific question]
-**Back:** [Concise answer with brief explanation]
-**Tags:** #concept1 #concept2
-**Difficulty:** 2/5
-**Source:** (Title, p.X)
-
----
-
-### Card 2 (Cloze)
-**Text:** The {{c1::base case}} prevents infinite recursion by providing a {{c2::termination condition}}.
-**Tags:** #recursion #fundamentals
-**Difficulty:** 1/5
-**Source:** (Title, p.Y)
-
----
-
-## Spaced Repetition Schedule
-- **Today (Day 1):** Review all cards
-- **Day 3:** Review cards 1, 3, 5, 7, 9
-- **Day 7:** Review cards with difficulty 3+
-- **Day 14:** Review all cards again
-"""
+    ctx = format_citations(hits[:5])
     
     user = f"""Create {num_cards} flashcards for: **{query}**
 
@@ -268,7 +282,7 @@ Generate varied flashcards (mix Q&A and cloze formats). Focus on key concepts an
         response = client.chat.completions.create(
             model=CHAT_MODEL,
             messages=[
-                {"role": "system", "content": system},
+                {"role": "system", "content": FLASHCARDS_SYSTEM_PROMPT},
                 {"role": "user", "content": user}
             ],
             temperature=0.3,
@@ -304,19 +318,14 @@ def analyze_progress(memory: Dict, quiz_history: List[Dict]) -> Dict:
     mastery_scores = memory.get("mastery_scores", {})
     
     # Analyze query patterns
-    topic_frequency = {}
-    for q in last_queries:
-        if isinstance(q, dict):
-            query_text = q.get("query", "")
-        else:
-            query_text = str(q)
-        
-        words = query_text.lower().split()
-        for word in words:
-            if len(word) > 4:
-                topic_frequency[word] = topic_frequency.get(word, 0) + 1
-    
-    frequent_topics = sorted(topic_frequency.items(), key=lambda x: x[1], reverse=True)[:5]
+    topic_frequency = Counter(
+        token
+        for q in last_queries
+        for token in _TOPIC_TOKEN.findall(
+            (q.get("query", "") if isinstance(q, dict) else str(q)).lower()
+        )
+    )
+    frequent_topics = topic_frequency.most_common(5)
     
     # Generate recommendations
     recommendations = []
@@ -325,8 +334,7 @@ def analyze_progress(memory: Dict, quiz_history: List[Dict]) -> Dict:
         recommendations.append(f"📚 Review weak topics: {', '.join(weak_topics[:3])}")
     
     if len(quiz_history) > 0:
-        recent_scores = [q.get('score', 0) for q in quiz_history[-5:]]
-        avg_recent = sum(recent_scores) / len(recent_scores)
+        avg_recent = statistics.fmean(q.get('score', 0) for q in quiz_history[-5:])
         
         if avg_recent < 0.6:
             recommendations.append("⚠️ Quiz scores are low - consider reviewing fundamentals")
@@ -342,15 +350,25 @@ def analyze_progress(memory: Dict, quiz_history: List[Dict]) -> Dict:
         recommendations.append("💡 Start exploring more topics to build momentum.")
     
     # Mastery analysis
-    mastery_insights = []
-    for topic, data in mastery_scores.items():
-        avg = data.get("avg", 0.0)
-        if avg < 0.5:
-            mastery_insights.append(f"🔴 {topic}: Needs work ({avg*100:.0f}%)")
-        elif avg < 0.7:
-            mastery_insights.append(f"🟡 {topic}: Developing ({avg*100:.0f}%)")
-        else:
-            mastery_insights.append(f"🟢 {topic}: Strong ({avg*100:.0f}%)")
+    if len(mastery_scores) > _VECTORIZE_MASTERY_MIN:
+        avgs = np.fromiter(
+            (d.get("avg", 0.0) for d in mastery_scores.values()),
+            dtype=np.float64,
+            count=len(mastery_scores)
+        )
+        buckets = np.digitize(avgs, _MASTERY_BINS).tolist()
+        pcts = (avgs * 100).tolist()
+        mastery_insights = [
+            f"{_MASTERY_LEVELS[b][0]} {topic}: {_MASTERY_LEVELS[b][1]} ({pct:.0f}%)"
+            for topic, b, pct in zip(mastery_scores, buckets, pcts)
+        ]
+    else:
+        mastery_insights = [
+            f"🔴 {topic}: Needs work ({avg*100:.0f}%)" if avg < 0.5
+            else f"🟡 {topic}: Developing ({avg*100:.0f}%)" if avg < 0.7
+            else f"🟢 {topic}: Strong ({avg*100:.0f}%)"
+            for topic, avg in ((t, d.get("avg", 0.0)) for t, d in mastery_scores.items())
+        ]
     
     return {
         "frequent_topics": [t[0] for t in frequent_topics],
@@ -8,25 +8,44 @@ This orchestrator uses a streamlined approach:
 4. Proper error handling and logging
 """
 
-from typing import Dict, List, Optional, Any
-import json
-from openai import OpenAI
+from typing import Dict, List, Optional, Any, Tuple, AsyncIterator
+from collections import OrderedDict
+import asyncio
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+import httpx
+import numpy as np
+import orjson
+import tiktoken
+from openai import AsyncOpenAI
 from dataclasses import dataclass
 
-from agentpro_app.config import CHAT_MODEL, OPENAI_API_KEY
-from agentpro_app.rag import hybrid_retrieve
-from agentpro_app.memory import load as load_memory, log_query
+from agentpro_app.config import CHAT_MODEL, ROUTER_MODEL, PLANNER_MODEL, QUIZ_MODEL, MODEL_CONTEXT_TOKENS, OPENAI_API_KEY, LOG_LEVEL
+from agentpro_app.rag import hybrid_retrieve, embed_texts, course_version
+from agentpro_app.memory import log_query
 from agentpro_app.persistence import database as db
 
-# Initialize OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Initialize OpenAI client with one shared connection pool, sized for bursts
+# of concurrent requests, and explicit timeouts instead of the SDK defaults
+client = AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    max_retries=2,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=50),
+        timeout=httpx.Timeout(60.0, connect=5.0)
+    )
+)
 
-print("[ORCHESTRATOR] Initialized with model:", CHAT_MODEL)
+logger = logging.getLogger("studybuddy.orchestrator")
+logger.info("Initialized with model: %s (router: %s)", CHAT_MODEL, ROUTER_MODEL)
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class RoutingDecision:
-    """Structured routing decision from LLM."""
+    """Structured routing decision from LLM (immutable, so cached decisions can be shared)."""
     agent: str  # assistant, tutor, quiz_coach, planner, flashcards
     reasoning: str
     confidence: float
@@ -34,18 +53,302 @@ class RoutingDecision:
     response_type: str  # summary, guide, quiz, chat, plan, flashcards
 
 
-def route_request(query: str, mode_hint: Optional[str] = None) -> RoutingDecision:
+# Short-lived cache of retrieval results for repeated queries (retries, refreshes)
+RETRIEVAL_CACHE_TTL = 60  # seconds
+RETRIEVAL_CACHE_SIZE = 512
+_retrieval_cache: "OrderedDict[Tuple, Tuple[float, List[Dict]]]" = OrderedDict()
+_retrieval_cache_lock = threading.Lock()
+
+# Per-(user, course) stats rarely change between consecutive turns
+STATS_CACHE_TTL = 30  # seconds
+STATS_CACHE_SIZE = 1024
+_stats_cache: "OrderedDict[Tuple[str, str], Tuple[float, Dict]]" = OrderedDict()
+_stats_cache_lock = threading.Lock()
+
+# Mastery topics are matched against word n-grams of the query, up to this length
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_MAX_TOPIC_WORDS = 4
+
+# Response types whose generators personalize with user stats
+STATS_RESPONSE_TYPES = {"guide", "quiz", "plan"}
+
+# Default routing used when the router call fails
+FALLBACK_ROUTING = RoutingDecision(
+    agent="assistant",
+    reasoning="Default routing due to error",
+    confidence=0.5,
+    requires_retrieval=True,
+    response_type="chat"
+)
+
+# Upper bound on the planner's "Available Materials" block
+MAX_MATERIALS_CHARS = 8000
+
+# Tokens held back from the context budget for chat-format overhead
+CONTEXT_SAFETY_TOKENS = 256
+_encodings: Dict[str, Any] = {}  # model name -> tiktoken encoding
+
+# Mode hints whose requests almost always need course materials
+RETRIEVAL_MODES = {"summary", "guide", "quiz", "flashcards", "plan"}
+
+# Chunks to retrieve per response type when the caller doesn't set top_k
+RETRIEVAL_K = {"summary": 4, "guide": 8, "quiz": 8, "plan": 15, "flashcards": 6, "chat": 4}
+DEFAULT_RETRIEVAL_K = 8
+
+# Messages that are only a greeting/acknowledgement (plus at most one word,
+# e.g. "thanks again", "hi there") and never need course materials. The
+# whole message must match, so "ok make flashcards for graphs" still routes.
+_SMALL_TALK = re.compile(
+    r"^(hi|hello|hey|thanks|thank you|thx|ok|okay|cool|great|nice|bye|goodbye"
+    r"|good (morning|afternoon|evening|night))(\s+\w+)?[\s!.,]*$"
+)
+
+# Time expressions for _parse_time_from_query. Unit alternatives are
+# anchored with \b so "hrs/day" can't backtrack into a bare "hr" match.
+_HOUR_RE = re.compile(r'(\d+)\s*(?:hours?|hrs?)\b(?!\s*(?:per|/|each))')
+_DAY_RE = re.compile(r'(\d+)\s*days?\b')
+_HRS_PER_DAY_RE = re.compile(r'(\d+)\s*(?:hours?|hrs?)\b(?:\s*(?:per|/|each)\s*day)?')
+_WEEK_RE = re.compile(r'\bweeks?\b')
+_MONTH_RE = re.compile(r'\bmonths?\b')
+
+# Routing cache: exact (normalized query, mode hint) matches plus a semantic
+# tier that reuses a decision when a new query embeds close to a cached one
+ROUTE_CACHE_TTL = 3600  # seconds
+ROUTE_CACHE_SIZE = 2048
+ROUTE_SIMILARITY_THRESHOLD = 0.92
+_route_cache: "OrderedDict[Tuple[str, Optional[str]], Tuple[RoutingDecision, float, int]]" = OrderedDict()
+# Semantic tier storage, one row per cache slot, allocated on the first insert
+# and updated in place on insert/eviction so lookups never re-stack vectors
+_route_vecs: Optional[np.ndarray] = None  # (ROUTE_CACHE_SIZE, D) unit query vectors
+_route_slot_live: Optional[np.ndarray] = None
+_route_slot_time: Optional[np.ndarray] = None
+_route_slot_mode: Optional[np.ndarray] = None  # codes from _route_mode_codes
+_route_slot_keys: List[Optional[Tuple[str, Optional[str]]]] = [None] * ROUTE_CACHE_SIZE
+_route_free_slots: List[int] = list(range(ROUTE_CACHE_SIZE - 1, -1, -1))
+_route_mode_codes: Dict[Optional[str], int] = {}
+
+# Keyword pre-filter mirroring the "Routing Rules" in the routing prompt,
+# one group per rule (same order as _FAST_ROUTE_DECISIONS)
+_FAST_ROUTES = re.compile(
+    r"\b(summar(?:y|ize|ise))"
+    r"|\b(study guide|explain in detail)\b"
+    r"|\b(quiz(?:zes)?|test me)\b"
+    r"|\b(plan|schedule)\b"
+    r"|\b(flashcards?)\b"
+)
+_FAST_ROUTE_DECISIONS = (
+    ("assistant", "summary"),
+    ("tutor", "guide"),
+    ("quiz_coach", "quiz"),
+    ("planner", "plan"),
+    ("flashcards", "flashcards"),
+)
+_MATERIAL_WORDS = re.compile(r"\b(slides?|pdfs?|chapters?|notes|uploaded|materials?|documents?|lectures?)\b")
+
+# Zero-shot local classifier: example phrasings per route, embedded once with
+# the retrieval embedder and compared to the query by cosine similarity
+ROUTE_CLASSIFIER_THRESHOLD = 0.6
+_ROUTE_EXAMPLES = {
+    ("assistant", "summary"): [
+        "summarize this chapter",
+        "give me a short overview of the lecture",
+        "what are the main points of these notes",
+    ],
+    ("tutor", "guide"): [
+        "create a study guide for this topic",
+        "explain this concept in detail with examples",
+        "walk me through how this works step by step",
+    ],
+    ("quiz_coach", "quiz"): [
+        "quiz me on this topic",
+        "give me practice questions to check my understanding",
+        "test my knowledge of this material",
+    ],
+    ("planner", "plan"): [
+        "make me a study plan before the exam",
+        "help me schedule my studying for the week",
+        "how should I split my study time over the next few days",
+    ],
+    ("flashcards", "flashcards"): [
+        "make flashcards for these terms",
+        "create cards to help me memorize the definitions",
+    ],
+    ("assistant", "chat"): [
+        "what is recursion",
+        "what does this term mean",
+        "can you answer a quick question about the lecture",
+    ],
+}
+_route_example_labels: List[Tuple[str, str]] = []
+_route_example_matrix: Optional[np.ndarray] = None
+
+
+def _fast_route(query_lower: str, mode_hint: Optional[str]) -> Optional[RoutingDecision]:
     """
-    Use LLM to determine routing based on query intent.
+    Route obvious requests by keyword without an LLM call.
     
-    Args:
-        query: User's query text
-        mode_hint: Optional mode hint from API (quiz, plan, guide, etc.)
-        
-    Returns:
-        RoutingDecision with agent and response_type
+    Messages that are nothing but small talk route to chat without
+    retrieval; a routing keyword always wins over a greeting. Otherwise
+    returns None when no rule matches, several rules match, or the
+    mode hint disagrees with the matched response type.
     """
-    system_prompt = """You are an intelligent routing system for a study assistant.
+    if (
+        not mode_hint
+        and len(query_lower.split()) < 8
+        and "?" not in query_lower
+        and _SMALL_TALK.match(query_lower)
+        and not _MATERIAL_WORDS.search(query_lower)
+        and not _FAST_ROUTES.search(query_lower)
+    ):
+        return RoutingDecision(
+            agent="assistant",
+            reasoning="Small talk",
+            confidence=0.95,
+            requires_retrieval=False,
+            response_type="chat"
+        )
+    
+    matched = {m.lastindex - 1 for m in _FAST_ROUTES.finditer(query_lower)}
+    if len(matched) != 1:
+        return None
+    
+    agent, response_type = _FAST_ROUTE_DECISIONS[matched.pop()]
+    if mode_hint and mode_hint != response_type:
+        return None
+    
+    return RoutingDecision(
+        agent=agent,
+        reasoning="Matched routing rule keyword",
+        confidence=0.95,
+        requires_retrieval=_requires_retrieval(response_type, query_lower),
+        response_type=response_type
+    )
+
+
+def _requires_retrieval(response_type: str, query_lower: str) -> bool:
+    """Plans only need materials when the query refers to them; everything else does."""
+    return response_type != "plan" or bool(_MATERIAL_WORDS.search(query_lower))
+
+
+def _build_route_examples() -> None:
+    """Embed the example phrasings once (blocking; run it off the event loop)."""
+    global _route_example_matrix
+    labels, texts = [], []
+    for label, examples in _ROUTE_EXAMPLES.items():
+        labels.extend([label] * len(examples))
+        texts.extend(examples)
+    matrix = np.asarray(embed_texts(texts), dtype=np.float32)
+    _route_example_labels[:] = labels
+    _route_example_matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def _classify_route(query_lower: str, query_vec: np.ndarray, mode_hint: Optional[str]) -> Optional[RoutingDecision]:
+    """
+    Route by nearest example phrasing in embedding space.
+    
+    Returns None when the examples aren't embedded yet, or when the best
+    match is below ROUTE_CLASSIFIER_THRESHOLD or disagrees with the mode
+    hint, leaving the decision to the LLM.
+    """
+    if _route_example_matrix is None:
+        return None
+    
+    sims = _route_example_matrix @ query_vec
+    best = int(np.argmax(sims))
+    if sims[best] < ROUTE_CLASSIFIER_THRESHOLD:
+        return None
+    
+    agent, response_type = _route_example_labels[best]
+    if mode_hint and mode_hint != response_type:
+        return None
+    
+    return RoutingDecision(
+        agent=agent,
+        reasoning="Closest match to example phrasings",
+        confidence=round(float(sims[best]), 2),
+        requires_retrieval=_requires_retrieval(response_type, query_lower),
+        response_type=response_type
+    )
+
+
+def _route_cache_get(key: Tuple[str, Optional[str]], query_vec: Optional[np.ndarray]) -> Optional[RoutingDecision]:
+    """Look up a cached routing decision by exact key, then by embedding similarity."""
+    now = time.monotonic()
+    
+    cached = _route_cache.get(key)
+    if cached:
+        if now - cached[1] < ROUTE_CACHE_TTL:
+            _route_cache.move_to_end(key)
+            return cached[0]
+        del _route_cache[key]
+        _free_route_slot(cached[2])
+    
+    mode_code = _route_mode_codes.get(key[1])
+    if query_vec is None or _route_vecs is None or mode_code is None:
+        return None
+    
+    # Semantic tier: only compare against live entries with the same mode hint
+    candidates = _route_slot_live & (_route_slot_mode == mode_code) & (now - _route_slot_time < ROUTE_CACHE_TTL)
+    if not candidates.any():
+        return None
+    
+    sims = np.where(candidates, _route_vecs @ query_vec, -1.0)
+    best = int(np.argmax(sims))
+    if sims[best] < ROUTE_SIMILARITY_THRESHOLD:
+        return None
+    
+    best_key = _route_slot_keys[best]
+    _route_cache.move_to_end(best_key)
+    return _route_cache[best_key][0]
+
+
+def _free_route_slot(slot: int) -> None:
+    """Return a semantic-tier row to the free list."""
+    _route_slot_live[slot] = False
+    _route_slot_keys[slot] = None
+    _route_free_slots.append(slot)
+
+
+def _route_cache_put(key: Tuple[str, Optional[str]], decision: RoutingDecision, query_vec: np.ndarray) -> None:
+    """Store a routing decision, evicting the least recently used entries."""
+    global _route_vecs, _route_slot_live, _route_slot_time, _route_slot_mode
+    if _route_vecs is None:
+        _route_vecs = np.zeros((ROUTE_CACHE_SIZE, query_vec.shape[0]), dtype=np.float32)
+        _route_slot_live = np.zeros(ROUTE_CACHE_SIZE, dtype=bool)
+        _route_slot_time = np.zeros(ROUTE_CACHE_SIZE, dtype=np.float64)
+        _route_slot_mode = np.zeros(ROUTE_CACHE_SIZE, dtype=np.int32)
+    
+    existing = _route_cache.get(key)
+    if existing:
+        slot = existing[2]
+    else:
+        while len(_route_cache) >= ROUTE_CACHE_SIZE:
+            _, (_, _, old_slot) = _route_cache.popitem(last=False)
+            _free_route_slot(old_slot)
+        slot = _route_free_slots.pop()
+    
+    now = time.monotonic()
+    _route_vecs[slot] = query_vec
+    _route_slot_live[slot] = True
+    _route_slot_time[slot] = now
+    _route_slot_mode[slot] = _route_mode_codes.setdefault(key[1], len(_route_mode_codes))
+    _route_slot_keys[slot] = key
+    _route_cache[key] = (decision, now, slot)
+    _route_cache.move_to_end(key)
+
+
+def _embed_query(query: str) -> Optional[np.ndarray]:
+    """Unit-normalized query embedding for the semantic route cache."""
+    try:
+        vec = np.asarray(embed_texts([query])[0], dtype=np.float32)
+    except Exception as e:
+        logger.warning("Embedding unavailable, skipping semantic route cache: %s", e)
+        return None
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else None
+
+
+ROUTING_RULES_PROMPT = """You are an intelligent routing system for a study assistant.
 
 Analyze the user's request and determine the best agent and response type.
 
@@ -74,7 +377,9 @@ Analyze the user's request and determine the best agent and response type.
 
 **For Planner:**
 - requires_retrieval: true if user mentions materials, documents, slides, specific topics
-- requires_retrieval: false for general time-based planning without content reference
+- requires_retrieval: false for general time-based planning without content reference"""
+
+ROUTING_SYSTEM_PROMPT = ROUTING_RULES_PROMPT + """
 
 Return ONLY valid JSON:
 {
@@ -85,113 +390,504 @@ Return ONLY valid JSON:
   "response_type": "type"
 }"""
 
-    # Build user prompt with mode hint if available
+CHAT_SYSTEM_PROMPT = """You are a friendly study assistant.
+Answer questions directly and conversationally.
+Use the provided course materials as context.
+Be helpful but concise."""
+
+# Routing and the plain chat answer in one call (see generate_chat_with_routing)
+ROUTED_CHAT_SYSTEM_PROMPT = ROUTING_RULES_PROMPT + """
+
+**Answering:**
+If the request routes to assistant + chat, also answer it in "content":
+""" + CHAT_SYSTEM_PROMPT + """
+For any other route, leave "content" empty; another agent will handle it."""
+
+ROUTED_CHAT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "routing": {
+            "type": "object",
+            "properties": {
+                "agent": {"type": "string", "enum": ["assistant", "tutor", "quiz_coach", "planner", "flashcards"]},
+                "reasoning": {"type": "string"},
+                "confidence": {"type": "number"},
+                "requires_retrieval": {"type": "boolean"},
+                "response_type": {"type": "string", "enum": ["summary", "guide", "quiz", "chat", "plan", "flashcards"]}
+            },
+            "required": ["agent", "reasoning", "confidence", "requires_retrieval", "response_type"],
+            "additionalProperties": False
+        },
+        "content": {"type": "string"}
+    },
+    "required": ["routing", "content"],
+    "additionalProperties": False
+}
+
+
+def _routing_user_prompt(query: str, mode_hint: Optional[str]) -> str:
+    """Build the router's user prompt with the mode hint if available."""
     user_prompt = f"Route this request: '{query}'"
     if mode_hint:
         user_prompt += f"\n\nMode hint provided: {mode_hint}"
+    return user_prompt
+
+
+def _routing_request_body(query: str, mode_hint: Optional[str]) -> Dict:
+    """Chat completion parameters for an LLM routing call (live or batched)."""
+    return _chat_params(
+        ROUTING_SYSTEM_PROMPT,
+        _routing_user_prompt(query, mode_hint),
+        model=ROUTER_MODEL,
+        temperature=0.2,
+        max_tokens=256,
+        response_format={"type": "json_object"}
+    )
+
+
+def _parse_routing(result: Dict) -> RoutingDecision:
+    """Build a RoutingDecision from the router's decoded JSON reply."""
+    return RoutingDecision(
+        agent=result.get("agent", "assistant"),
+        reasoning=result.get("reasoning", ""),
+        confidence=result.get("confidence", 0.7),
+        requires_retrieval=result.get("requires_retrieval", True),
+        response_type=result.get("response_type", "chat")
+    )
+
+
+async def _route_locally(
+    query: str,
+    mode_hint: Optional[str]
+) -> Tuple[Optional[RoutingDecision], Tuple[str, Optional[str]], Optional[np.ndarray]]:
+    """
+    Try the keyword, cache and classifier tiers of routing without an LLM call.
     
-    try:
-        response = client.chat.completions.create(
-            model=CHAT_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.2,
-            max_tokens=256,
-            response_format={"type": "json_object"}
-        )
-        
-        result = json.loads(response.choices[0].message.content)
+    Returns:
+        (decision or None, route cache key, query embedding or None)
+    """
+    query_lower = query.lower().strip()
+    cache_key = (query_lower, mode_hint)
+    fast = _fast_route(query_lower, mode_hint)
+    if fast:
+        return fast, cache_key, None
+    
+    query_vec = await asyncio.to_thread(_embed_query, query_lower)
+    cached = _route_cache_get(cache_key, query_vec)
+    if cached:
+        return cached, cache_key, query_vec
+    
+    if query_vec is not None:
+        if _route_example_matrix is None:
+            await asyncio.to_thread(_build_route_examples)
+        classified = _classify_route(query_lower, query_vec, mode_hint)
+        if classified:
+            return classified, cache_key, query_vec
+    
+    return None, cache_key, query_vec
+
+
+async def generate_chat_with_routing(
+    query: str,
+    context: str,
+    mode_hint: Optional[str] = None
+) -> Tuple[RoutingDecision, str]:
+    """
+    Route a request and, if it is plain chat, answer it in the same LLM call.
+    
+    Returns:
+        (routing decision, answer text; empty unless routed to chat)
+    """
+    user_prompt = f"{_routing_user_prompt(query, mode_hint)}\n\nContext:\n{context}"
+    reply = await _chat(
+        ROUTED_CHAT_SYSTEM_PROMPT,
+        user_prompt,
+        temperature=0.5,
+        max_tokens=1280,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "routed_chat", "strict": True, "schema": ROUTED_CHAT_SCHEMA}
+        }
+    )
+    
+    result = orjson.loads(reply)
+    decision = _parse_routing(result["routing"])
+    content = result["content"] if decision.response_type == "chat" else ""
+    return decision, content
+
+
+async def route_request(query: str, mode_hint: Optional[str] = None) -> RoutingDecision:
+    """
+    Use LLM to determine routing based on query intent.
+    
+    Obvious requests are routed by keyword, repeated or near-duplicate
+    queries reuse a cached decision, and queries close to a known phrasing
+    are classified locally, so only ambiguous queries reach the LLM.
+    
+    Args:
+        query: User's query text
+        mode_hint: Optional mode hint from API (quiz, plan, guide, etc.)
         
-        return RoutingDecision(
-            agent=result.get("agent", "assistant"),
-            reasoning=result.get("reasoning", ""),
-            confidence=result.get("confidence", 0.7),
-            requires_retrieval=result.get("requires_retrieval", True),
-            response_type=result.get("response_type", "chat")
-        )
+    Returns:
+        RoutingDecision with agent and response_type
+    """
+    decision, cache_key, query_vec = await _route_locally(query, mode_hint)
+    if decision:
+        return decision
+    return await _route_with_llm(query, mode_hint, cache_key, query_vec)
+
+
+async def _route_with_llm(
+    query: str,
+    mode_hint: Optional[str],
+    cache_key: Tuple[str, Optional[str]],
+    query_vec: Optional[np.ndarray]
+) -> RoutingDecision:
+    """LLM tier of route_request; caches the decision when the query was embedded."""
+    try:
+        response = await client.chat.completions.create(**_routing_request_body(query, mode_hint))
+        decision = _parse_routing(orjson.loads(response.choices[0].message.content))
+        if query_vec is not None:
+            _route_cache_put(cache_key, decision, query_vec)
+        return decision
         
     except Exception as e:
-        print(f"[ROUTING ERROR] {str(e)}")
-        # Fallback routing
-        return RoutingDecision(
-            agent="assistant",
-            reasoning="Default routing due to error",
-            confidence=0.5,
-            requires_retrieval=True,
-            response_type="chat"
-        )
+        logger.error("Routing failed, using fallback: %s", e)
+        return FALLBACK_ROUTING
 
 
-def format_context_for_llm(hits: List[Dict]) -> str:
-    """Format retrieval results for LLM context."""
-    if not hits:
-        return "No course materials found."
+async def route_requests_batch(queries: List[str], poll_interval: float = 30.0) -> List[RoutingDecision]:
+    """
+    Route many queries through the OpenAI Batch API.
     
-    formatted = []
-    for i, h in enumerate(hits, 1):
-        title = h.get('meta', {}).get('title', 'Document')
-        page = h.get('meta', {}).get('page', '?')
-        text = h.get('text', '')[:400]  # Truncate for context window
-        score = h.get('score', 0.0)
+    Meant for offline evaluation (e.g. nightly routing evals): batched calls
+    cost about half as much but may take up to 24h to complete, so never
+    call this from a request path.
+    
+    Args:
+        queries: Query texts to route
+        poll_interval: Seconds between batch status checks
         
-        formatted.append(
-            f"[{i}] (Source: {title}, p.{page}, relevance: {score:.2f})\n{text}...\n"
-        )
+    Returns:
+        RoutingDecision per query, in input order
+    """
+    lines = [
+        orjson.dumps({
+            "custom_id": str(i),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": _routing_request_body(query, None)
+        })
+        for i, query in enumerate(queries)
+    ]
+    batch_file = await client.files.create(
+        file=("routing_batch.jsonl", b"\n".join(lines)),
+        purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    logger.info("Submitted %d queries as routing batch %s", len(queries), batch.id)
+    
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(poll_interval)
+        batch = await client.batches.retrieve(batch.id)
+    
+    if batch.status != "completed" or not batch.output_file_id:
+        raise RuntimeError(f"Routing batch {batch.id} ended with status '{batch.status}'")
+    
+    output = await client.files.content(batch.output_file_id)
+    decisions = [FALLBACK_ROUTING] * len(queries)
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        item = orjson.loads(line)
+        response = item.get("response") or {}
+        if response.get("status_code") != 200:
+            continue
+        try:
+            decisions[int(item["custom_id"])] = _parse_routing(
+                orjson.loads(response["body"]["choices"][0]["message"]["content"])
+            )
+        except (KeyError, IndexError, ValueError) as e:
+            logger.warning("Bad routing batch result for %s: %s", item.get("custom_id"), e)
     
-    return "\n".join(formatted)
+    return decisions
+
 
+def _shingles(text: str) -> set:
+    """Word 3-gram shingles of a chunk's opening, for near-duplicate checks."""
+    words = text[:200].lower().split()
+    return {" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
 
-def extract_citations(hits: List[Dict]) -> List[Dict]:
-    """Extract unique citations from retrieval results."""
+
+def _distinct_hits(
+    hits: List[Dict],
+    min_score_ratio: float = 0.3,
+    max_overlap: float = 0.8,
+    top_score: Optional[float] = None
+) -> List[Dict]:
+    """
+    Drop the low-relevance tail and near-duplicate chunks from retrieval results.
+    
+    A hit is dropped when its score is below min_score_ratio of the best score,
+    or when its opening shares more than max_overlap (Jaccard) of its shingles
+    with a hit already kept. Pass top_score if the caller already knows it.
+    """
+    if top_score is None:
+        top_score = max((h.get('score', 0.0) for h in hits), default=0.0)
+    cutoff = top_score * min_score_ratio if top_score > 0 else float("-inf")
+    
+    kept = []
+    kept_shingles = []
+    for h in hits:
+        if h.get('score', 0.0) < cutoff:
+            continue
+        shingles = _shingles(h.get('text', ''))
+        if any(len(shingles & seen) / len(shingles | seen) > max_overlap for seen in kept_shingles):
+            continue
+        kept.append(h)
+        kept_shingles.append(shingles)
+    
+    return kept
+
+
+@dataclass(slots=True)
+class ContextSummary:
+    """Retrieval results condensed for generation and the response payload."""
+    context: str
+    citations: List[Dict]
+    avg_score: float
+    max_score: float
+
+
+def summarize_hits(hits: List[Dict], max_chars: int = 300) -> ContextSummary:
+    """
+    Condense retrieval hits into the LLM context, citations and score stats.
+    
+    Scores are read once up front (the relevance cutoff needs the best one),
+    then context and citations are built in a single pass over the kept hits.
+    Weak and near-duplicate chunks are skipped (see _distinct_hits); citations
+    come from the first five kept chunks, one per (title, page).
+    """
+    if not hits:
+        return ContextSummary("No course materials found.", [], 0.0, 0.0)
+    
+    scores = [h.get('score', 0.0) for h in hits]
+    max_score = max(scores)
+    
+    formatted = []
     citations = []
     seen = set()
-    
-    for h in hits[:5]:
-        title = h.get('meta', {}).get('title')
-        page = h.get('meta', {}).get('page')
-        key = (title, page)
+    for i, h in enumerate(_distinct_hits(hits, top_score=max_score), 1):
+        meta = h.get('meta', {})
+        title = meta.get('title')
+        page = meta.get('page')
+        score = h.get('score', 0.0)
+        
+        formatted.append(
+            f"[{i}|{title or 'Document'} p{'?' if page is None else page}|{score:.2f}]\n"
+            f"{h.get('text', '')[:max_chars]}\n"
+        )
         
-        if key not in seen and title:
+        key = (title, page)
+        if i <= 5 and title and key not in seen:
             citations.append({
                 "title": title,
                 "page": page,
                 "snippet": h.get('snippet', '')[:150],
-                "score": h.get('score', 0.0)
+                "score": score
             })
             seen.add(key)
     
-    return citations
+    return ContextSummary("\n".join(formatted), citations, sum(scores) / len(scores), max_score)
 
 
-def generate_summary(query: str, context: str) -> str:
-    """Generate a concise summary."""
-    system_prompt = """You are a helpful assistant that provides clear, concise summaries.
+def _cached_retrieve(user_id: str, course_id: str, query: str, top_k: int) -> List[Dict]:
+    """
+    hybrid_retrieve with a TTL cache on (user, course, normalized query, top_k).
+    The course version is part of the key, so an upload invalidates old entries.
+    """
+    key = (user_id, course_id, course_version(user_id, course_id), " ".join(query.lower().split()), top_k)
+    now = time.monotonic()
+    
+    with _retrieval_cache_lock:
+        cached = _retrieval_cache.get(key)
+        if cached and now - cached[0] < RETRIEVAL_CACHE_TTL:
+            _retrieval_cache.move_to_end(key)
+            return cached[1]
+    
+    hits = hybrid_retrieve(user_id, course_id, query, k=top_k)
+    
+    with _retrieval_cache_lock:
+        _retrieval_cache[key] = (now, hits)
+        _retrieval_cache.move_to_end(key)
+        while len(_retrieval_cache) > RETRIEVAL_CACHE_SIZE:
+            _retrieval_cache.popitem(last=False)
+    
+    return hits
+
+
+def _mastery_lookup(mastery_scores: Dict) -> Dict[str, str]:
+    """Map each mastery topic, lowercased and split into words, back to its key."""
+    return {" ".join(_WORD_RE.findall(topic.lower())): topic for topic in mastery_scores}
 
-Focus on the main points and key takeaways.
-Keep your response brief and well-organized.
-Do NOT create study guides or extensive explanations - just summarize.
-If context is insufficient, say so briefly."""
 
-    user_prompt = f"Summarize: {query}\n\nContext:\n{context}"
+def _match_mastery_topic(query: str, mastery_lower: Dict[str, str]) -> Optional[str]:
+    """Return the mastery topic named by the longest word n-gram of the query."""
+    if not mastery_lower:
+        return None
     
-    response = client.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=[
+    words = _WORD_RE.findall(query.lower())
+    for n in range(min(len(words), _MAX_TOPIC_WORDS), 0, -1):
+        for i in range(len(words) - n + 1):
+            topic = mastery_lower.get(" ".join(words[i:i + n]))
+            if topic:
+                return topic
+    return None
+
+
+def _cached_stats(user_id: str, course_id: str) -> Dict:
+    """db.get_stats with a short TTL cache per (user, course)."""
+    key = (user_id, course_id)
+    now = time.monotonic()
+    
+    with _stats_cache_lock:
+        cached = _stats_cache.get(key)
+        if cached and now - cached[0] < STATS_CACHE_TTL:
+            _stats_cache.move_to_end(key)
+            return cached[1]
+    
+    stats = db.get_stats(user_id, course_id)
+    # Normalized topic -> original key, built once per load for generate_quiz
+    stats["_mastery_lower"] = _mastery_lookup(stats.get("mastery_scores", {}))
+    
+    with _stats_cache_lock:
+        _stats_cache[key] = (now, stats)
+        _stats_cache.move_to_end(key)
+        while len(_stats_cache) > STATS_CACHE_SIZE:
+            _stats_cache.popitem(last=False)
+    
+    return stats
+
+
+def _chat_params(
+    system_prompt: str,
+    user_prompt: str,
+    *,
+    model: Optional[str] = None,
+    temperature: float = 0.3,
+    max_tokens: int = 1024,
+    response_format: Optional[Dict] = None
+) -> Dict:
+    """Chat completion parameters shared by every LLM call in this module (model defaults to CHAT_MODEL)."""
+    params = {
+        "model": model or CHAT_MODEL,
+        "messages": [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ],
-        temperature=0.3,
-        max_tokens=1024
-    )
+        "temperature": temperature,
+        "max_tokens": max_tokens
+    }
+    if response_format:
+        params["response_format"] = response_format
+    return params
+
+
+def _get_encoding(model: Optional[str]):
+    """Tokenizer for model, falling back to cl100k_base for unset or unknown models."""
+    enc = _encodings.get(model)
+    if enc is None:
+        if model:
+            try:
+                enc = tiktoken.encoding_for_model(model)
+            except KeyError:
+                pass
+        if enc is None:
+            enc = tiktoken.get_encoding("cl100k_base")
+        _encodings[model] = enc
+    return enc
+
+
+def _encode(enc, text: str) -> List[int]:
+    # Course PDFs and queries may contain literal special-token text such as
+    # "<|endoftext|>"; encode it as plain text instead of raising
+    return enc.encode(text, disallowed_special=())
+
+
+# Load tokenizers at import: tiktoken may download BPE files on first use,
+# which must not happen inside a request on the event loop
+for _model in {CHAT_MODEL, PLANNER_MODEL, QUIZ_MODEL}:
+    _get_encoding(_model)
+
+
+def fit_context(context: str, system_prompt: str, user_prompt: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """
+    Trim context so the full prompt plus the completion reservation fits the
+    model's context window.
     
+    user_prompt is the user message as sent, minus the context; the budget
+    left after it, the system prompt, max_tokens and CONTEXT_SAFETY_TOKENS
+    goes to context. model defaults to CHAT_MODEL.
+    """
+    enc = _get_encoding(model or CHAT_MODEL)
+    budget = (
+        MODEL_CONTEXT_TOKENS - len(_encode(enc, system_prompt)) - len(_encode(enc, user_prompt))
+        - max_tokens - CONTEXT_SAFETY_TOKENS
+    )
+    tokens = _encode(enc, context)
+    if len(tokens) <= budget:
+        return context
+    logger.warning("Context trimmed from %d to %d tokens to fit the model window", len(tokens), max(budget, 0))
+    return enc.decode(tokens[:max(budget, 0)])
+
+
+async def _chat(system_prompt: str, user_prompt: str, **kwargs) -> str:
+    """Run a chat completion and return the reply text (kwargs as for _chat_params)."""
+    response = await client.chat.completions.create(**_chat_params(system_prompt, user_prompt, **kwargs))
     return response.choices[0].message.content
 
 
-def generate_study_guide(query: str, context: str, user_stats: Dict) -> str:
-    """Generate a comprehensive study guide."""
-    system_prompt = """You are an expert tutor creating comprehensive study guides.
+async def _stream_completion(system_prompt: str, user_prompt: str, **kwargs) -> AsyncIterator[str]:
+    """Stream a chat completion, yielding text deltas as they arrive (kwargs as for _chat_params)."""
+    stream = await client.chat.completions.create(
+        **_chat_params(system_prompt, user_prompt, **kwargs),
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+        if chunk.usage:
+            logger.debug(
+                "Completion usage: %d prompt + %d completion tokens",
+                chunk.usage.prompt_tokens, chunk.usage.completion_tokens
+            )
+
+
+SUMMARY_SYSTEM_PROMPT = """You are a helpful assistant that provides clear, concise summaries.
+
+Focus on the main points and key takeaways.
+Keep your response brief and well-organized.
+Do NOT create study guides or extensive explanations - just summarize.
+If context is insufficient, say so briefly."""
+
+
+async def generate_summary(query: str, context: str) -> AsyncIterator[str]:
+    """Generate a concise summary."""
+    prompt_head = f"Summarize: {query}\n\nContext:\n"
+    context = fit_context(context, SUMMARY_SYSTEM_PROMPT, prompt_head, 1024)
+    user_prompt = prompt_head + context
+    
+    async for piece in _stream_completion(SUMMARY_SYSTEM_PROMPT, user_prompt, temperature=0.3, max_tokens=1024):
+        yield piece
+
+
+GUIDE_SYSTEM_PROMPT = """You are an expert tutor creating comprehensive study guides.
 
 Create well-structured guides with:
 1. Topic Overview
@@ -203,54 +899,26 @@ Create well-structured guides with:
 Use inline citations: (Source, p.X) after each claim.
 Make it educational and thorough."""
 
+
+async def generate_study_guide(query: str, context: str, user_stats: Dict) -> AsyncIterator[str]:
+    """Generate a comprehensive study guide."""
     # Add personalization
     weak_topics = user_stats.get("weak_topics", [])
     personalization = ""
     if weak_topics:
         personalization = f"\n\nNote: Student needs extra help with: {', '.join(weak_topics)}"
     
-    user_prompt = f"Create a study guide for: {query}\n\nCourse Materials:\n{context}{personalization}"
+    prompt_head = f"Create a study guide for: {query}\n\nCourse Materials:\n"
+    context = fit_context(context, GUIDE_SYSTEM_PROMPT, prompt_head + personalization, 2048)
+    user_prompt = prompt_head + context + personalization
     
-    response = client.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        temperature=0.3,
-        max_tokens=2048
-    )
-    
-    return response.choices[0].message.content
+    async for piece in _stream_completion(GUIDE_SYSTEM_PROMPT, user_prompt, temperature=0.3, max_tokens=2048):
+        yield piece
 
 
-def generate_quiz(query: str, context: str, difficulty: str, num_questions: int, user_stats: Dict) -> str:
-    """Generate an adaptive quiz."""
-    # Adaptive difficulty adjustment
-    mastery_scores = user_stats.get("mastery_scores", {})
-    query_lower = query.lower()
-    
-    # Find relevant topic in mastery
-    relevant_topic = None
-    for topic in mastery_scores.keys():
-        if topic.lower() in query_lower or query_lower in topic.lower():
-            relevant_topic = topic
-            break
-    
-    # Adjust difficulty based on mastery
-    adaptive_note = ""
-    if relevant_topic:
-        avg_score = mastery_scores[relevant_topic].get('avg', 0.0)
-        if avg_score >= 0.85 and difficulty == "medium":
-            difficulty = "hard"
-            adaptive_note = "\n\n**Coach's Note:** Increased difficulty to 'hard' based on your strong performance (>85%)."
-        elif avg_score < 0.6 and difficulty == "medium":
-            difficulty = "easy"
-            adaptive_note = "\n\n**Coach's Note:** Starting with 'easy' difficulty to build confidence (<60%)."
-    
-    system_prompt = f"""You are an expert educator creating assessments.
+QUIZ_SYSTEM_PROMPT = """You are an expert educator creating assessments.
 
-Generate a {difficulty} difficulty quiz with {num_questions} questions.
+Generate a quiz at the difficulty and length given in the request.
 
 **Instructions:**
 1. Mix question types: Multiple Choice, True/False, Short Answer
@@ -259,7 +927,7 @@ Generate a {difficulty} difficulty quiz with {num_questions} questions.
 4. Base questions on provided materials
 
 **Format:**
-## Quiz: [Topic] - {difficulty.title()} Level
+## Quiz: [Topic] - [Difficulty] Level
 
 ### Question 1 (Multiple Choice)
 **Q:** [Question text] _(Source, p.X)_
@@ -272,92 +940,45 @@ D) [Option D]
 ## Answer Key
 **Q1:** B - [Detailed explanation] _(p.X)_"""
 
-    user_prompt = f"Create quiz on: {query}\n\nCourse content:\n{context}"
-    
-    response = client.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        temperature=0.4,
-        max_tokens=2048
-    )
-    
-    content = response.choices[0].message.content
-    return adaptive_note + content if adaptive_note else content
 
-
-def generate_study_plan(
-    query: str, 
-    user_stats: Dict, 
-    deadline: Optional[str], 
-    hours_per_day: int,
-    retrieval_results: List[Dict] = None
-) -> str:
-    """
-    Generate a flexible, RAG-aware study plan.
-    
-    Handles human requests like:
-    - "make me a 2 hour plan"
-    - "give me a 7 day schedule, 2 hrs/day"
-    - "use the slides I uploaded"
-    - "focus on linear algebra"
-    """
-    from datetime import datetime
-    import re
-    
-    # Parse flexible time requests from query
-    time_info = _parse_time_from_query(query, deadline, hours_per_day)
-    
-    # Build user context
-    weak_topics = user_stats.get("weak_topics", [])
-    strong_topics = user_stats.get("strong_topics", [])
-    recent_queries = user_stats.get("total_queries", 0)
-    
-    user_context = []
-    if weak_topics:
-        user_context.append(f"Weak areas: {', '.join(weak_topics[:3])}")
-    if strong_topics:
-        user_context.append(f"Strong areas: {', '.join(strong_topics[:3])}")
+async def generate_quiz(query: str, context: str, difficulty: str, num_questions: int, user_stats: Dict) -> AsyncIterator[str]:
+    """Generate an adaptive quiz."""
+    # Adaptive difficulty adjustment
+    mastery_scores = user_stats.get("mastery_scores", {})
+    mastery_lower = user_stats.get("_mastery_lower")
+    if mastery_lower is None:
+        mastery_lower = _mastery_lookup(mastery_scores)
     
-    trend = user_stats.get('recent_trend', 'stable')
-    if trend == 'declining':
-        user_context.append("Recent performance declining — needs foundational review")
-    elif trend == 'improving':
-        user_context.append("Making progress — can handle challenge")
+    # Find relevant topic in mastery
+    relevant_topic = _match_mastery_topic(query, mastery_lower)
     
-    user_context_str = "\n".join(user_context) if user_context else "New student — no history yet"
+    # Adjust difficulty based on mastery
+    adaptive_note = ""
+    if relevant_topic:
+        avg_score = mastery_scores[relevant_topic].get('avg', 0.0)
+        if avg_score >= 0.85 and difficulty == "medium":
+            difficulty = "hard"
+            adaptive_note = "\n\n**Coach's Note:** Increased difficulty to 'hard' based on your strong performance (>85%)."
+        elif avg_score < 0.6 and difficulty == "medium":
+            difficulty = "easy"
+            adaptive_note = "\n\n**Coach's Note:** Starting with 'easy' difficulty to build confidence (<60%)."
     
-    # Build RAG context with specific material references
-    materials_context = ""
-    if retrieval_results and len(retrieval_results) > 0:
-        materials_context = "\n\n**Available Materials:**\n"
-        
-        # Group by document
-        docs = {}
-        for i, hit in enumerate(retrieval_results[:15], 1):
-            title = hit.get('meta', {}).get('title', 'Document')
-            page = hit.get('meta', {}).get('page', '?')
-            text_preview = hit.get('text', '')[:150]
-            
-            if title not in docs:
-                docs[title] = []
-            docs[title].append({
-                'chunk_id': i,
-                'page': page,
-                'preview': text_preview
-            })
-        
-        for title, chunks in docs.items():
-            materials_context += f"\n**{title}:**\n"
-            for chunk in chunks[:5]:  # Max 5 chunks per doc
-                materials_context += f"  • Chunk {chunk['chunk_id']} (p.{chunk['page']}): {chunk['preview']}...\n"
+    prompt_head = (
+        f"Create a {difficulty} difficulty quiz with {num_questions} questions on: {query}"
+        f"\n\nCourse content:\n"
+    )
+    context = fit_context(context, QUIZ_SYSTEM_PROMPT, prompt_head, 2048, model=QUIZ_MODEL)
+    user_prompt = prompt_head + context
     
-    # System prompt - flexible and RAG-aware
-    system_prompt = f"""You are StudyPlanner, a flexible, human-aware study planning agent.
+    if adaptive_note:
+        yield adaptive_note
+    async for piece in _stream_completion(QUIZ_SYSTEM_PROMPT, user_prompt, model=QUIZ_MODEL, temperature=0.4, max_tokens=2048):
+        yield piece
+
+
+PLANNER_SYSTEM_PROMPT = """You are StudyPlanner, a flexible, human-aware study planning agent.
 
-**CRITICAL: Follow the EXACT timeline provided below. Do NOT invent different timelines.**
+**CRITICAL: Follow the EXACT timeline provided in the request. Do NOT invent different timelines.**
 
 **Core Responsibilities:**
 1. **Follow Timeline Exactly**: Use the exact number of days/hours specified. If timeline says "2 days", create a 2-day plan, NOT 7 days or 30 days.
@@ -391,7 +1012,7 @@ def generate_study_plan(
 For 1-3 hours:
 ```
 ## Study Session: [Topic]
-**Duration:** {time_info['days']} day, {time_info['hours_per_day']} hours
+**Duration:** [days] day, [hours] hours
 
 ### Time Breakdown
 • 0:00-0:45 → Study [Topic from Chunk X]
@@ -402,7 +1023,7 @@ For 1-3 hours:
 For 2-5 days:
 ```
 ## Study Plan: [Topic]
-**Timeline:** {time_info['days']} days, {time_info['hours_per_day']} hrs/day
+**Timeline:** [days] days, [hours] hrs/day
 
 ### Day 1
 • Study: Chunk X, Y (pages A-B)
@@ -413,14 +1034,49 @@ For 2-5 days:
 • New: Chunk Z (pages C-D)
 ```
 
-**REMEMBER**: Create a plan for EXACTLY {time_info['days']} days at {time_info['hours_per_day']} hours/day."""
+**REMEMBER**: Create a plan for EXACTLY the number of days and hours/day in the request."""
 
-    # User prompt with all context
-    print(f"[PLANNER] Timeline: {time_info['days']} days, {time_info['hours_per_day']} hrs/day (Source: {time_info['source']})")
-    print(f"[PLANNER] Total hours: {time_info['total_hours']}")
-    print(f"[PLANNER] Materials available: {len(retrieval_results)} chunks")
+
+async def generate_study_plan(
+    query: str, 
+    user_stats: Dict, 
+    deadline: Optional[str], 
+    hours_per_day: int,
+    retrieval_results: List[Dict] = None
+) -> AsyncIterator[str]:
+    """
+    Generate a flexible, RAG-aware study plan.
     
-    user_prompt = f"""User Request: {query}
+    Handles human requests like:
+    - "make me a 2 hour plan"
+    - "give me a 7 day schedule, 2 hrs/day"
+    - "use the slides I uploaded"
+    - "focus on linear algebra"
+    """
+    # Parse flexible time requests from query
+    time_info = _parse_time_from_query(query, deadline, hours_per_day)
+    
+    # Build user context
+    weak_topics = user_stats.get("weak_topics", [])
+    strong_topics = user_stats.get("strong_topics", [])
+    recent_queries = user_stats.get("total_queries", 0)
+    
+    user_context = []
+    if weak_topics:
+        user_context.append(f"Weak areas: {', '.join(weak_topics[:3])}")
+    if strong_topics:
+        user_context.append(f"Strong areas: {', '.join(strong_topics[:3])}")
+    
+    trend = user_stats.get('recent_trend', 'stable')
+    if trend == 'declining':
+        user_context.append("Recent performance declining — needs foundational review")
+    elif trend == 'improving':
+        user_context.append("Making progress — can handle challenge")
+    
+    user_context_str = "\n".join(user_context) if user_context else "New student — no history yet"
+    
+    # User prompt around the materials block, which is sized to fit between them
+    prompt_head = f"""User Request: {query}
 
 **IMPORTANT - FOLLOW THIS TIMELINE EXACTLY:**
 - Number of days: {time_info['days']}
@@ -432,21 +1088,56 @@ For 2-5 days:
 
 **Student Context:**
 {user_context_str}
-{materials_context}
+"""
+    prompt_tail = f"""
 
 Generate a practical, actionable study plan for EXACTLY {time_info['days']} days at {time_info['hours_per_day']} hours per day. Reference the specific chunks/pages from the available materials."""
     
-    response = client.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        temperature=0.4,
-        max_tokens=2500
+    # Build RAG context with specific material references
+    materials_context = ""
+    if retrieval_results and len(retrieval_results) > 0:
+        # Group by document
+        docs = {}
+        for i, hit in enumerate(_distinct_hits(retrieval_results[:15]), 1):
+            title = hit.get('meta', {}).get('title', 'Document')
+            page = hit.get('meta', {}).get('page', '?')
+            text_preview = hit.get('text', '')[:150]
+            
+            if title not in docs:
+                docs[title] = []
+            docs[title].append({
+                'chunk_id': i,
+                'page': page,
+                'preview': text_preview
+            })
+        
+        parts = ["\n\n**Available Materials:**\n"]
+        size = len(parts[0])
+        for title, chunks in docs.items():
+            lines = [f"\n**{title}:**\n"]
+            lines.extend(
+                f"  • Chunk {chunk['chunk_id']} (p.{chunk['page']}): {chunk['preview']}...\n"
+                for chunk in chunks[:5]  # Max 5 chunks per doc
+            )
+            block = "".join(lines)
+            if size + len(block) > MAX_MATERIALS_CHARS:
+                break
+            parts.append(block)
+            size += len(block)
+        materials_context = fit_context(
+            "".join(parts), PLANNER_SYSTEM_PROMPT, prompt_head + prompt_tail, 2500, model=PLANNER_MODEL
+        )
+    
+    logger.debug(
+        "Planner timeline: %s days, %s hrs/day (source: %s), %s total hours, %d material chunks",
+        time_info['days'], time_info['hours_per_day'], time_info['source'],
+        time_info['total_hours'], len(retrieval_results or [])
     )
     
-    return response.choices[0].message.content
+    user_prompt = prompt_head + materials_context + prompt_tail
+    
+    async for piece in _stream_completion(PLANNER_SYSTEM_PROMPT, user_prompt, model=PLANNER_MODEL, temperature=0.4, max_tokens=2500):
+        yield piece
 
 
 def _parse_time_from_query(query: str, deadline: Optional[str], hours_per_day: int) -> Dict:
@@ -459,28 +1150,24 @@ def _parse_time_from_query(query: str, deadline: Optional[str], hours_per_day: i
     - "help me for next week" → 7 days
     - "I have a month" → 30 days
     """
-    import re
-    from datetime import datetime, timedelta
-    
     query_lower = query.lower()
-    print(f"[TIME_PARSE] Parsing: '{query}'")
-    print(f"[TIME_PARSE] Deadline: {deadline}, Hours/day: {hours_per_day}")
+    logger.debug("Parsing time from %r (deadline: %s, hours/day: %s)", query, deadline, hours_per_day)
     
     # Validate and clean deadline
     valid_deadline = None
     if deadline and deadline.lower() not in ['string', 'null', 'none', '']:
         try:
             valid_deadline = datetime.fromisoformat(deadline.replace('Z', '+00:00'))
-            print(f"[TIME_PARSE] Valid deadline parsed: {valid_deadline}")
+            logger.debug("Valid deadline parsed: %s", valid_deadline)
         except Exception as e:
-            print(f"[TIME_PARSE] Invalid deadline '{deadline}': {e}")
+            logger.debug("Invalid deadline %r: %s", deadline, e)
             valid_deadline = None
     
     # Try to extract hours from query (for single-session plans)
-    hour_match = re.search(r'(\d+)\s*(?:hour|hr|hours|hrs)(?!\s*(?:per|/|each))', query_lower)
+    hour_match = _HOUR_RE.search(query_lower)
     if hour_match:
         total_hours = int(hour_match.group(1))
-        print(f"[TIME_PARSE] Found hours: {total_hours}")
+        logger.debug("Found hours: %d", total_hours)
         return {
             'days': 1,
             'hours_per_day': total_hours,
@@ -490,17 +1177,17 @@ def _parse_time_from_query(query: str, deadline: Optional[str], hours_per_day: i
         }
     
     # Try to extract days from query (priority over deadline)
-    day_match = re.search(r'(\d+)\s*(?:day|days)', query_lower)
+    day_match = _DAY_RE.search(query_lower)
     if day_match:
         days = int(day_match.group(1))
         # Try to find hours per day
-        hrs_match = re.search(r'(\d+)\s*(?:hour|hr|hours|hrs)(?:\s*(?:per|/|each)\s*day)?', query_lower)
-        if hrs_match and 'per' in query_lower or '/' in query_lower or 'each' in query_lower:
+        hrs_match = _HRS_PER_DAY_RE.search(query_lower)
+        if hrs_match and ('per' in query_lower or '/' in query_lower or 'each' in query_lower):
             hrs = int(hrs_match.group(1))
         else:
             hrs = hours_per_day or 2
         
-        print(f"[TIME_PARSE] Found days: {days}, hours/day: {hrs}")
+        logger.debug("Found days: %d, hours/day: %s", days, hrs)
         return {
             'days': days,
             'hours_per_day': hrs,
@@ -510,10 +1197,10 @@ def _parse_time_from_query(query: str, deadline: Optional[str], hours_per_day: i
         }
     
     # Check for common time expressions
-    if 'week' in query_lower:
+    if _WEEK_RE.search(query_lower):
         days = 7
         hrs = hours_per_day or 2
-        print(f"[TIME_PARSE] Found 'week': {days} days")
+        logger.debug("Found 'week': %d days", days)
         return {
             'days': days,
             'hours_per_day': hrs,
@@ -522,10 +1209,10 @@ def _parse_time_from_query(query: str, deadline: Optional[str], hours_per_day: i
             'source': 'query_week'
         }
     
-    if 'month' in query_lower:
+    if _MONTH_RE.search(query_lower):
         days = 30
         hrs = hours_per_day or 2
-        print(f"[TIME_PARSE] Found 'month': {days} days")
+        logger.debug("Found 'month': %d days", days)
         return {
             'days': days,
             'hours_per_day': hrs,
@@ -538,7 +1225,7 @@ def _parse_time_from_query(query: str, deadline: Optional[str], hours_per_day: i
     if valid_deadline:
         days_until = max(1, (valid_deadline - datetime.now()).days)
         hrs = hours_per_day or 2
-        print(f"[TIME_PARSE] Using deadline: {days_until} days")
+        logger.debug("Using deadline: %d days", days_until)
         return {
             'days': days_until,
             'hours_per_day': hrs,
@@ -550,7 +1237,7 @@ def _parse_time_from_query(query: str, deadline: Optional[str], hours_per_day: i
     # Default fallback
     default_days = 7
     default_hrs = hours_per_day or 2
-    print(f"[TIME_PARSE] Using default: {default_days} days")
+    logger.debug("Using default: %d days", default_days)
     return {
         'days': default_days,
         'hours_per_day': default_hrs,
@@ -560,15 +1247,13 @@ def _parse_time_from_query(query: str, deadline: Optional[str], hours_per_day: i
     }
 
 
-def generate_flashcards(query: str, context: str, num_cards: int) -> str:
-    """Generate spaced-repetition flashcards."""
-    system_prompt = f"""You are creating flashcards for spaced repetition learning.
+FLASHCARDS_SYSTEM_PROMPT = """You are creating flashcards for spaced repetition learning.
 
-Create {num_cards} concise, focused flashcards.
+Create the requested number of concise, focused flashcards.
 
 **Formats:**
 1. Q&A: Question → Answer
-2. Cloze: The {{{{c1::answer}}}} format
+2. Cloze: The {{c1::answer}} format
 
 **Output:**
 ## Flashcard Set: [Topic]
@@ -581,7 +1266,7 @@ Create {num_cards} concise, focused flashcards.
 **Source:** (Title, p.X)
 
 ### Card 2 (Cloze)
-**Text:** The {{{{c1::base case}}}} prevents infinite recursion.
+**Text:** The {{c1::base case}} prevents infinite recursion.
 **Tags:** #recursion
 **Difficulty:** 1/5
 **Source:** (Title, p.Y)
@@ -592,22 +1277,18 @@ Create {num_cards} concise, focused flashcards.
 - Day 7: Review difficult cards
 - Day 14: Review all"""
 
-    user_prompt = f"Create {num_cards} flashcards for: {query}\n\nContext:\n{context}"
-    
-    response = client.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
-        temperature=0.3,
-        max_tokens=2048
-    )
+
+async def generate_flashcards(query: str, context: str, num_cards: int) -> AsyncIterator[str]:
+    """Generate spaced-repetition flashcards."""
+    prompt_head = f"Create {num_cards} flashcards for: {query}\n\nContext:\n"
+    context = fit_context(context, FLASHCARDS_SYSTEM_PROMPT, prompt_head, 2048)
+    user_prompt = prompt_head + context
     
-    return response.choices[0].message.content
+    async for piece in _stream_completion(FLASHCARDS_SYSTEM_PROMPT, user_prompt, temperature=0.3, max_tokens=2048):
+        yield piece
 
 
-def process_request(
+async def process_request_stream(
     query: str,
     user_id: str,
     course_id: str,
@@ -615,13 +1296,18 @@ def process_request(
     difficulty: str = "medium",
     num_questions: int = 6,
     num_items: Optional[int] = None,
-    top_k: int = 8,
+    top_k: Optional[int] = None,
     deadline: Optional[str] = None,
     hours_per_day: int = 2,
     **kwargs
-) -> Dict:
+) -> AsyncIterator[Dict]:
     """
-    Main entry point for processing requests.
+    Main entry point for processing requests, streaming the answer.
+    
+    Yields {"type": "delta", "content": str} events as text is generated,
+    then one {"type": "result", "response": Dict} event with the full
+    response (content, routing, citations, thought_process). On a
+    generation error the result's content replaces any partial deltas.
     
     Args:
         query: User's query
@@ -631,44 +1317,79 @@ def process_request(
         difficulty: Quiz difficulty (easy, medium, hard)
         num_questions: Number of quiz questions
         num_items: Generic num items (for flashcards, etc.)
-        top_k: Number of retrieval results
+        top_k: Number of retrieval results (default depends on response type)
         deadline: Study plan deadline
         hours_per_day: Daily study hours for planning
         
-    Returns:
-        Response dict with ok, content, agent, routing, thought_process
+    Yields:
+        Delta events, then the trailing result event
     """
-    print(f"\n[ORCHESTRATOR] Processing query: '{query[:50]}...'")
-    print(f"[ORCHESTRATOR] Mode hint: {mode}")
+    logger.debug("Processing query %r (mode hint: %s)", query[:50], mode)
+    
+    # Step 1: Route the request, overlapping retrieval when the mode hint makes it near-certain
+    retrieval_task = None
+    retrieval_k = 0
+    if mode in RETRIEVAL_MODES:
+        retrieval_k = top_k or RETRIEVAL_K[mode]
+        retrieval_task = asyncio.create_task(
+            asyncio.to_thread(_cached_retrieve, user_id, course_id, query, retrieval_k)
+        )
     
-    # Step 1: Route the request
-    routing = route_request(query, mode_hint=mode)
-    print(f"[ROUTING] Agent: {routing.agent}, Type: {routing.response_type}")
-    print(f"[ROUTING] Reasoning: {routing.reasoning}")
+    routing, cache_key, query_vec = await _route_locally(query, mode)
+    fused_content = None
+    if routing is None:
+        # Ambiguous query: retrieve first so a single LLM call can route it
+        # and, for plain chat, answer it without a separate routing round-trip
+        if retrieval_task is None:
+            retrieval_k = top_k or RETRIEVAL_K["chat"]
+            retrieval_task = asyncio.create_task(
+                asyncio.to_thread(_cached_retrieve, user_id, course_id, query, retrieval_k)
+            )
+        hits = await retrieval_task
+        if hits:
+            try:
+                routing, fused_content = await generate_chat_with_routing(query, summarize_hits(hits).context, mode)
+                if query_vec is not None:
+                    _route_cache_put(cache_key, routing, query_vec)
+            except Exception as e:
+                logger.warning("Fused routing failed, routing separately: %s", e)
+        if routing is None:
+            routing = await _route_with_llm(query, mode, cache_key, query_vec)
+    logger.info("Routed to %s/%s: %s", routing.agent, routing.response_type, routing.reasoning)
     
-    # Step 2: Load user stats and memory
-    user_stats = db.get_stats(user_id, course_id)
-    memory = load_memory(user_id, course_id)
+    # Step 2: Load user stats (only for personalized generators), overlapping retrieval
+    stats_task = None
+    if routing.response_type in STATS_RESPONSE_TYPES:
+        stats_task = asyncio.create_task(asyncio.to_thread(_cached_stats, user_id, course_id))
     
     # Step 3: Retrieve course materials (if needed)
     retrieval_results = []
+    hits_summary = summarize_hits([])
     context_str = ""
-    citations = []
     
     # Planner now uses RAG when available for material-aware planning
     if routing.requires_retrieval or routing.agent == "planner":
-        print(f"[RAG] Retrieving top {top_k} chunks...")
-        retrieval_results = hybrid_retrieve(user_id, course_id, query, k=top_k)
-        print(f"[RAG] Retrieved {len(retrieval_results)} chunks")
+        k = top_k or RETRIEVAL_K.get(routing.response_type, DEFAULT_RETRIEVAL_K)
+        logger.debug("Retrieving top %d chunks", k)
+        if retrieval_task is not None and retrieval_k >= k:
+            retrieval_results = await retrieval_task
+        else:
+            if retrieval_task is not None:
+                retrieval_task.cancel()
+            retrieval_results = await asyncio.to_thread(_cached_retrieve, user_id, course_id, query, k)
+        logger.debug("Retrieved %d chunks", len(retrieval_results))
         
         if retrieval_results:
-            context_str = format_context_for_llm(retrieval_results)
-            citations = extract_citations(retrieval_results)
+            hits_summary = summarize_hits(retrieval_results)
+            context_str = hits_summary.context
         else:
-            print("[RAG] No relevant materials found")
+            logger.debug("No relevant materials found")
+    elif retrieval_task is not None:
+        retrieval_task.cancel()
     
     # Step 4: Generate response based on routing decision
     content = ""
+    stream = None
     thought_process = [
         {
             "step": "routing",
@@ -683,9 +1404,11 @@ def process_request(
             "step": "retrieval",
             "results": {
                 "count": len(retrieval_results),
-                "avg_score": sum(h.get('score', 0) for h in retrieval_results) / len(retrieval_results) if retrieval_results else 0.0
+                "avg_score": hits_summary.avg_score,
+                "max_score": hits_summary.max_score
             }
-        }
+        },
+        None  # generation step, filled in below
     ]
     
     try:
@@ -693,32 +1416,37 @@ def process_request(
             if not retrieval_results:
                 content = "**No materials found to summarize.**\n\nPlease upload course materials first."
             else:
-                content = generate_summary(query, context_str)
+                stream = generate_summary(query, context_str)
                 
         elif routing.response_type == "guide":
             if not retrieval_results:
                 content = "**No materials found for study guide.**\n\nPlease upload course materials first."
             else:
-                content = generate_study_guide(query, context_str, user_stats)
+                stream = generate_study_guide(query, context_str, await stats_task)
                 
         elif routing.response_type == "quiz":
             if not retrieval_results:
                 content = "**No materials found for quiz generation.**\n\nPlease upload course materials first."
             else:
-                content = generate_quiz(query, context_str, difficulty, num_questions, user_stats)
+                stream = generate_quiz(query, context_str, difficulty, num_questions, await stats_task)
                 
         elif routing.response_type == "plan":
-            content = generate_study_plan(query, user_stats, deadline, hours_per_day, retrieval_results)
+            stream = generate_study_plan(query, await stats_task, deadline, hours_per_day, retrieval_results)
             
         elif routing.response_type == "flashcards":
             num_cards = num_items or 10
             if not retrieval_results:
                 content = "**No materials found for flashcards.**\n\nPlease upload course materials first."
             else:
-                content = generate_flashcards(query, context_str, num_cards)
+                stream = generate_flashcards(query, context_str, num_cards)
                 
         else:  # chat
-            if not retrieval_results:
+            if fused_content:
+                # The fused routing call already answered; don't pay for a second call
+                content = fused_content
+            elif not routing.requires_retrieval:
+                stream = _stream_completion(CHAT_SYSTEM_PROMPT, query, temperature=0.5, max_tokens=1024)
+            elif not retrieval_results:
                 content = """I don't have any course materials to reference for this question.
 
 **To get started:**
@@ -731,45 +1459,46 @@ I can help you with:
 - Study plans and schedules
 - Flashcards for review"""
             else:
-                system_prompt = """You are a friendly study assistant.
-Answer questions directly and conversationally.
-Use the provided course materials as context.
-Be helpful but concise."""
-                
                 user_prompt = f"{query}\n\nContext:\n{context_str}"
-                
-                response = client.chat.completions.create(
-                    model=CHAT_MODEL,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    temperature=0.5,
-                    max_tokens=1024
-                )
-                content = response.choices[0].message.content
+                stream = _stream_completion(CHAT_SYSTEM_PROMPT, user_prompt, temperature=0.5, max_tokens=1024)
         
-        thought_process.append({
+        if stream is None:
+            yield {"type": "delta", "content": content}
+        else:
+            parts = []
+            async for piece in stream:
+                parts.append(piece)
+                yield {"type": "delta", "content": piece}
+            content = "".join(parts)
+        
+        thought_process[2] = {
             "step": "generation",
             "agent": routing.agent,
             "response_type": routing.response_type,
             "success": True
-        })
+        }
         
     except Exception as e:
-        print(f"[ERROR] Generation failed: {str(e)}")
+        logger.exception("Generation failed")
         content = f"**Error generating response:** {str(e)}\n\nPlease try again or rephrase your question."
-        thought_process.append({
+        thought_process[2] = {
             "step": "generation",
             "error": str(e),
             "success": False
-        })
-    
+        }
+    finally:
+        # No-materials branches, errors and client disconnects never await the stats lookup
+        if stats_task is not None:
+            if not stats_task.done():
+                stats_task.cancel()
+            elif not stats_task.cancelled():
+                stats_task.exception()  # mark any failure as retrieved
+
     # Step 5: Log the query
     log_query(user_id, course_id, query, routing.response_type)
     
     # Step 6: Return structured response
-    return {
+    yield {"type": "result", "response": {
         "ok": True,
         "content": content,
         "agent": routing.agent,
@@ -782,14 +1511,54 @@ Be helpful but concise."""
             "mode_hint": mode
         },
         "thought_process": thought_process,
-        "citations": citations,
+        "citations": hits_summary.citations,
         "context": {
             "user_id": user_id,
             "course_id": course_id,
             "retrieval_count": len(retrieval_results),
             "has_materials": len(retrieval_results) > 0
         }
-    }
+    }}
+
+
+async def process_request(
+    query: str,
+    user_id: str,
+    course_id: str,
+    mode: Optional[str] = None,
+    difficulty: str = "medium",
+    num_questions: int = 6,
+    num_items: Optional[int] = None,
+    top_k: Optional[int] = None,
+    deadline: Optional[str] = None,
+    hours_per_day: int = 2,
+    **kwargs
+) -> Dict:
+    """
+    Buffered variant of process_request_stream for callers that want one response dict.
+    
+    Returns:
+        Response dict with ok, content, agent, routing, thought_process
+    """
+    stream = process_request_stream(
+        query, user_id, course_id,
+        mode=mode,
+        difficulty=difficulty,
+        num_questions=num_questions,
+        num_items=num_items,
+        top_k=top_k,
+        deadline=deadline,
+        hours_per_day=hours_per_day,
+        **kwargs
+    )
+    try:
+        async for event in stream:
+            if event["type"] == "result":
+                return event["response"]
+    finally:
+        # Returning mid-iteration leaves the generator suspended; close it here
+        # rather than leaving its cleanup to garbage collection
+        await stream.aclose()
 
 
 # Test function for debugging
@@ -802,10 +1571,16 @@ if __name__ == "__main__":
         "What is recursion?"
     ]
     
-    for test_query in test_cases:
-        print(f"\n{'='*60}")
-        print(f"Test: {test_query}")
-        routing = route_request(test_query)
-        print(f"→ Agent: {routing.agent}")
-        print(f"→ Type: {routing.response_type}")
-        print(f"→ Reasoning: {routing.reasoning}")
\ No newline at end of file
+    logging.basicConfig(level=LOG_LEVEL, format="[%(name)s] %(levelname)s %(message)s")
+    
+    async def _run_tests():
+        # Route all cases concurrently; use route_requests_batch for large eval sets
+        results = await asyncio.gather(*(route_request(q) for q in test_cases))
+        for test_query, routing in zip(test_cases, results):
+            print(f"\n{'='*60}")
+            print(f"Test: {test_query}")
+            print(f"→ Agent: {routing.agent}")
+            print(f"→ Type: {routing.response_type}")
+            print(f"→ Reasoning: {routing.reasoning}")
+    
+    asyncio.run(_run_tests())
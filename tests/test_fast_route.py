@@ -0,0 +1,50 @@
+"""
+Keyword pre-routing in the root orchestrator: greetings mixed with a real
+request must keep their route and retrieval.
+"""
+
+import os
+
+import pytest
+
+for _dep in ("dotenv", "numpy", "httpx", "openai", "orjson", "tiktoken", "chromadb", "pypdf", "rank_bm25"):
+    pytest.importorskip(_dep)
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("CHAT_MODEL", "gpt-4o-mini")
+os.environ.setdefault("MODEL_PROVIDER", "openai")
+
+from improved_orchestrator import _fast_route  # noqa: E402
+
+
+@pytest.mark.parametrize("query", [
+    "hi",
+    "hello!",
+    "thanks again.",
+    "ok",
+    "good morning",
+])
+def test_pure_small_talk_skips_retrieval(query):
+    decision = _fast_route(query, None)
+    assert decision is not None
+    assert decision.response_type == "chat"
+    assert decision.requires_retrieval is False
+
+
+@pytest.mark.parametrize("query, response_type", [
+    ("hi, quiz me on sorting algorithms", "quiz"),
+    ("ok make flashcards for graphs", "flashcards"),
+    ("thanks! now summarize recursion", "summary"),
+    ("great, give me a study plan", "plan"),
+    ("ok quiz", "quiz"),
+])
+def test_greeting_prefix_keeps_keyword_route(query, response_type):
+    decision = _fast_route(query, None)
+    assert decision is not None
+    assert decision.response_type == response_type
+    assert decision.reasoning != "Small talk"
+
+
+def test_greeting_prefix_without_keyword_defers_to_router():
+    # No routing keyword matches, so the decision is left to the classifier/LLM
+    assert _fast_route("okay explain dynamic programming in detail", None) is None